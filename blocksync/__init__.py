@@ -1,5 +1,6 @@
+from blocksync._estimate import Estimate, estimate
 from blocksync._status import Status
 from blocksync._sync_manager import SyncManager
 from blocksync.sync import local_to_local, local_to_remote, remote_to_local
 
-__all__ = ["local_to_local", "local_to_remote", "remote_to_local", "Status", "SyncManager"]
+__all__ = ["local_to_local", "local_to_remote", "remote_to_local", "estimate", "Estimate", "Status", "SyncManager"]
@@ -1,12 +1,16 @@
 import re
 from pathlib import Path
 
-__all__ = ["BASE_DIR", "ByteSizes", "SAME", "SKIP", "DIFF"]
+__all__ = ["BASE_DIR", "ByteSizes", "SAME", "SKIP", "DIFF", "COPY", "END", "DEFAULT_DAEMON_PORT", "CHUNK_SIZE"]
 
 BASE_DIR = Path(__file__).parent
-SAME: str = "0"
-SKIP: str = "1"
-DIFF: str = "2"
+SAME: bytes = b"0"
+SKIP: bytes = b"1"
+DIFF: bytes = b"2"
+COPY: bytes = b"3"
+# Ends a stream early, no role relies on EOF since TLS connections cannot be half-closed
+END: bytes = b"4"
+DEFAULT_DAEMON_PORT: int = 7797
 
 
 class ByteSizes:
@@ -35,3 +39,7 @@ class ByteSizes:
                 size, unit = matched.group(1), matched.group(2).strip()
                 return int(size) * getattr(ByteSizes, unit.upper())
         return int(size)
+
+
+# Largest piece of data read, hashed or sent at once
+CHUNK_SIZE: int = 8 * ByteSizes.MiB
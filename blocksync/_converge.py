@@ -0,0 +1,108 @@
+import logging
+import threading
+import timeit
+from typing import IO, Callable, Generator, Tuple, Union
+
+from blocksync._hooks import Hooks
+from blocksync._pipeline import get_chunk_size, read_range
+from blocksync._status import Status
+from blocksync._sync_manager import SyncManager
+
+__all__ = ["Converger", "get_dirty_blocks"]
+
+logger = logging.getLogger("blocksync")
+
+
+class Converger:
+    """
+    Coordinates the incremental passes of a converge sync across workers.
+
+    After the first full pass, every pass only transfers the source blocks whose digest changed since the
+    previous pass. Once a pass finds few enough dirty blocks or finishes fast enough, the on_converge hook
+    runs (e.g. to freeze the source) and a last pass is made.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        status: Status,
+        manager: SyncManager,
+        hooks: Hooks,
+        max_dirty_blocks: int,
+        pass_time: Union[int, float],
+        max_passes: int,
+    ):
+        self.status: Status = status
+        self.manager: SyncManager = manager
+        self.hooks: Hooks = hooks
+        self.max_dirty_blocks: int = max_dirty_blocks
+        self.pass_time: Union[int, float] = pass_time
+        self.max_passes: int = max_passes
+        self.passes: int = 0
+        self.final: bool = False
+        self.done: bool = False
+        self._lock = threading.Lock()
+        self._dirty_blocks: int = 0
+        self._t_pass = timeit.default_timer()
+        self._barrier = threading.Barrier(workers, action=self._end_pass)
+
+    def add_dirty_blocks(self, count: int):
+        with self._lock:
+            self._dirty_blocks += count
+
+    def _end_pass(self):
+        t_cur = timeit.default_timer()
+        elapsed, self._t_pass = t_cur - self._t_pass, t_cur
+        self.passes += 1
+        logger.info(f"Pass {self.passes}: {self._dirty_blocks} dirty blocks in {elapsed:.3f}s")
+        if self.final or self.manager.canceled:
+            self.done = True
+        elif (
+            self._dirty_blocks <= self.max_dirty_blocks
+            or elapsed <= self.pass_time
+            or self.max_passes <= self.passes + 1
+        ):
+            self.hooks.run_converge(self.status)
+            self.final = True
+        self._dirty_blocks = 0
+        # The hook may take a while, do not count it towards the next pass
+        self._t_pass = timeit.default_timer()
+
+    def next_pass(self) -> bool:
+        """
+        Wait for the other workers to finish the current pass, return whether another pass follows
+        """
+        try:
+            self._barrier.wait()
+        except threading.BrokenBarrierError:
+            return False
+        return not self.done
+
+    def abort(self):
+        self._barrier.abort()
+
+
+def get_dirty_blocks(
+    fileobj: IO,
+    startpos: int,
+    block_size: int,
+    digests: bytearray,
+    hash_: Callable,
+) -> Generator[Tuple[int, int], None, None]:
+    """
+    Yield the offset and length of the source blocks whose digest differs from the recorded one,
+    recording the new digest
+    """
+    digest_size = hash_().digest_size
+    chunk_size = get_chunk_size(block_size)
+    for i in range(0, len(digests), digest_size):
+        offset = startpos + i // digest_size * block_size
+        block_hash, length = hash_(), 0
+        for chunk in read_range(fileobj, offset, block_size, chunk_size):
+            block_hash.update(chunk)
+            length += len(chunk)
+        if not length:
+            break
+        if (digest := block_hash.digest()) != digests[i : i + digest_size]:
+            digests[i : i + digest_size] = digest
+            yield offset, length
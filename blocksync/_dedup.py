@@ -0,0 +1,36 @@
+import threading
+from typing import Dict, Optional
+
+__all__ = ["DedupIndex"]
+
+
+class DedupIndex:
+    """
+    Maps block digests to destination offsets whose content is final for the rest of the sync,
+    so a differing block can be copied from there instead of being transferred
+    """
+
+    # A 128 bit prefix keeps the table small while collisions stay negligible
+    KEY_SIZE: int = 16
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._offsets: Dict[bytes, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def add(self, digest: bytes, offset: int):
+        with self._lock:
+            self._offsets.setdefault(digest[: self.KEY_SIZE], offset)
+
+    def discard(self, digest: bytes, offset: int):
+        """
+        Forget offset once its content changes
+        """
+        with self._lock:
+            if self._offsets.get(digest[: self.KEY_SIZE]) == offset:
+                del self._offsets[digest[: self.KEY_SIZE]]
+
+    def get(self, digest: bytes) -> Optional[int]:
+        return self._offsets.get(digest[: self.KEY_SIZE])
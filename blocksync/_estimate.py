@@ -0,0 +1,145 @@
+import random
+import timeit
+from math import ceil, sqrt
+from statistics import NormalDist
+from typing import Any, Callable, List, Literal, Optional, Tuple, Union
+
+from blocksync._consts import ByteSizes
+from blocksync._status import Status
+
+__all__ = ["Estimate", "estimate", "sample_blocks"]
+
+
+def sample_blocks(
+    total_blocks: int,
+    samples: int,
+    sampling: Literal["stratified", "random"] = "stratified",
+    rng: Optional[random.Random] = None,
+) -> List[int]:
+    """
+    Pick block indexes uniformly at random, or one at random within each of samples equal strata of the device
+    """
+    rng = rng or random.Random()
+    samples = min(samples, total_blocks)
+    if sampling == "random":
+        return sorted(rng.sample(range(total_blocks), samples))
+    if sampling == "stratified":
+        return [rng.randrange(i * total_blocks // samples, (i + 1) * total_blocks // samples) for i in range(samples)]
+    raise ValueError(f"Unknown sampling: {sampling}")
+
+
+class Estimate:
+    """
+    Diff ratio, bytes to transfer and sync duration projected from a dry run over sampled blocks.
+
+    The interval is the Wilson score interval at the given confidence with a finite population correction.
+    The projected duration scales the time the sampled blocks took to compare (elapsed) to every block.
+    Sampled blocks are read at random offsets, so it leans on the pessimistic side. The transfer time of
+    the differing blocks is only added when the link bandwidth is known.
+    """
+
+    def __init__(
+        self,
+        status: Status,
+        total_blocks: int,
+        confidence: float,
+        elapsed: float,
+        bandwidth: Optional[int] = None,
+    ):
+        self.block_size: int = status.block_size
+        self.src_size: int = status.src_size
+        self.total_blocks: int = total_blocks
+        self.sampled_blocks: int = status.blocks["done"]
+        self.diff_blocks: int = status.blocks["diff"]
+        self.confidence: float = confidence
+        self.diff_ratio, self.diff_ratio_low, self.diff_ratio_high = self._get_interval()
+        self.bytes_to_transfer: int = round(self.diff_ratio * self.src_size)
+        self.bytes_to_transfer_low: int = round(self.diff_ratio_low * self.src_size)
+        self.bytes_to_transfer_high: int = round(self.diff_ratio_high * self.src_size)
+        self.elapsed: float = elapsed
+        self.projected_duration: float = elapsed * total_blocks / max(1, self.sampled_blocks)
+        if bandwidth:
+            self.projected_duration += self.bytes_to_transfer / bandwidth
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def _get_interval(self) -> Tuple[float, float, float]:
+        n, population = self.sampled_blocks, self.total_blocks
+        if n == 0:
+            return 0.0, 0.0, 1.0
+        ratio = self.diff_blocks / n
+        if population <= n:
+            return ratio, ratio, ratio
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        denominator = 1 + z ** 2 / n
+        center = (ratio + z ** 2 / (2 * n)) / denominator
+        margin = z * sqrt(ratio * (1 - ratio) / n + z ** 2 / (4 * n ** 2)) / denominator
+        margin *= sqrt((population - n) / (population - 1))
+        return ratio, max(0.0, center - margin), min(1.0, center + margin)
+
+
+def estimate(
+    sync: Callable[..., Tuple[Any, Status]],
+    src: str,
+    dest: str,
+    samples: int = 1000,
+    sampling: Literal["stratified", "random"] = "stratified",
+    confidence: float = 0.95,
+    seed: Optional[int] = None,
+    bandwidth: Optional[Union[str, int]] = None,
+    block_size: Union[str, int] = ByteSizes.MiB,
+    **sync_options,
+) -> Estimate:
+    """
+    Estimate a sync by comparing only sampled blocks with a dry run of the given sync function
+    (local_to_local, local_to_remote or remote_to_local), which takes the remaining options.
+    The samples are compared by a single worker: worker ranges are not aligned to blocks, so a sampled
+    block could otherwise be split between two workers and counted twice.
+    """
+    if isinstance(block_size, str):
+        block_size = ByteSizes.parse_readable_byte_size(block_size)
+    if isinstance(bandwidth, str):
+        bandwidth = ByteSizes.parse_readable_byte_size(bandwidth)
+    rng = random.Random(seed)
+    total_blocks = 0
+    sync_options.pop("workers", None)
+    user_monitor: Optional[Callable[[Status], Any]] = sync_options.pop("monitor", None)
+    monitoring_interval: Union[int, float] = sync_options.pop("monitoring_interval", 1)
+    # Time and number of compared blocks after the first and the last compared block
+    observed: List[Tuple[float, int]] = []
+    t_monitor = timeit.default_timer()
+
+    def monitor(status: Status):
+        nonlocal t_monitor
+        t_cur = timeit.default_timer()
+        observed[1 if observed else 0 :] = [(t_cur, status.blocks["done"])]
+        if user_monitor is not None and monitoring_interval <= t_cur - t_monitor:
+            user_monitor(status)
+            t_monitor = t_cur
+
+    def get_extents(src_size: int) -> List[Tuple[int, int]]:
+        nonlocal total_blocks
+        total_blocks = ceil(src_size / block_size)
+        return [(index * block_size, block_size) for index in sample_blocks(total_blocks, samples, sampling, rng)]
+
+    t_start = timeit.default_timer()
+    _, status = sync(
+        src,
+        dest,
+        block_size=block_size,
+        workers=1,
+        wait=True,
+        dryrun=True,
+        extents=get_extents,
+        monitor=monitor,
+        monitoring_interval=0,
+        **sync_options,
+    )
+    elapsed = timeit.default_timer() - t_start
+    if len(observed) == 2 and observed[0][1] < observed[1][1]:
+        # Leave out connecting and deploying the servers by measuring the time per block between
+        # the first and the last compared block
+        (t_first, first), (t_last, last) = observed
+        elapsed = (t_last - t_first) / (last - first) * status.blocks["done"]
+    return Estimate(status, total_blocks, confidence, elapsed, bandwidth)
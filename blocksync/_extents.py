@@ -0,0 +1,133 @@
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+__all__ = ["read_extent_list", "read_bitmap", "merge_extents", "load_extents", "get_runs", "split_runs", "iter_offsets"]
+
+# (offset, length) in bytes
+Extent = Tuple[int, int]
+# (offset, blocks) of consecutive blocks of a worker range
+Run = Tuple[int, int]
+
+# dm-era era_invalidate prints ranges and single blocks as XML
+RANGE_PATTERN = re.compile(r'<range\s+begin="(\d+)"\s+end="(\d+)"')
+BLOCK_PATTERN = re.compile(r'<block\s+block="(\d+)"')
+
+
+def read_extent_list(path: str, granularity: int = 1) -> List[Extent]:
+    """
+    Read "offset length" lines (or dm-era XML output) in units of granularity bytes
+    """
+    extents: List[Extent] = []
+    with open(path, "r") as fileobj:
+        for line in fileobj:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if matched := RANGE_PATTERN.search(line):
+                begin, end = int(matched.group(1)), int(matched.group(2))
+                extents.append((begin * granularity, (end - begin) * granularity))
+            elif matched := BLOCK_PATTERN.search(line):
+                extents.append((int(matched.group(1)) * granularity, granularity))
+            elif not line.startswith("<"):
+                offset, length = line.replace(",", " ").split()
+                extents.append((int(offset) * granularity, int(length) * granularity))
+    return extents
+
+
+def read_bitmap(path: str, granularity: int) -> List[Extent]:
+    """
+    Read a bitmap whose bit i (least significant bit first) marks the i-th chunk of granularity bytes as changed
+    """
+    extents: List[Extent] = []
+    start: Optional[int] = None
+    with open(path, "rb") as fileobj:
+        bitmap = fileobj.read()
+    for i, byte in enumerate(bitmap):
+        if byte in (0, 0xFF) and (start is None) == (byte == 0):
+            # Nothing changes within this byte
+            continue
+        for bit in range(8):
+            if byte >> bit & 1:
+                if start is None:
+                    start = i * 8 + bit
+            elif start is not None:
+                extents.append((start * granularity, (i * 8 + bit - start) * granularity))
+                start = None
+    if start is not None:
+        extents.append((start * granularity, (len(bitmap) * 8 - start) * granularity))
+    return extents
+
+
+def merge_extents(extents: Iterable[Extent]) -> List[Extent]:
+    merged: List[Extent] = []
+    for offset, length in sorted(extent for extent in extents if 0 < extent[1]):
+        if merged and offset <= merged[-1][0] + merged[-1][1]:
+            last_offset, last_length = merged[-1]
+            merged[-1] = (last_offset, max(last_length, offset + length - last_offset))
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+def load_extents(
+    extents: Optional[Union[str, Iterable[Extent]]],
+    bitmap: Optional[str],
+    granularity: Optional[int],
+    block_size: int,
+) -> Optional[List[Extent]]:
+    """
+    Return the sorted and merged changed extents, or None when the whole device is synced.
+    Extent lists are in bytes and bitmaps in blocks unless a granularity is given.
+    """
+    if extents is None and bitmap is None:
+        return None
+    loaded: List[Extent] = []
+    if isinstance(extents, str):
+        loaded += read_extent_list(extents, granularity or 1)
+    elif extents is not None:
+        loaded += [(offset * (granularity or 1), length * (granularity or 1)) for offset, length in extents]
+    if bitmap is not None:
+        loaded += read_bitmap(bitmap, granularity or block_size)
+    return merge_extents(loaded)
+
+
+def get_runs(extents: List[Extent], startpos: int, maxblock: int, block_size: int) -> List[Run]:
+    """
+    Return the runs of blocks of a worker range that overlap the merged extents
+    """
+    runs: List[Run] = []
+    endpos = startpos + maxblock * block_size
+    for offset, length in extents:
+        if endpos <= offset:
+            break
+        if offset + length <= startpos:
+            continue
+        first = max(0, (offset - startpos) // block_size)
+        last = min(maxblock, -(-(offset + length - startpos) // block_size))
+        if runs and startpos + first * block_size <= runs[-1][0] + runs[-1][1] * block_size:
+            # Extents sharing a block
+            run_offset, _ = runs[-1]
+            runs[-1] = (run_offset, last - (run_offset - startpos) // block_size)
+        else:
+            runs.append((startpos + first * block_size, last - first))
+    return runs
+
+
+def split_runs(runs: List[Run], size: int, block_size: int) -> Tuple[List[Run], List[Run]]:
+    """
+    Split the runs into the blocks starting before size and the blocks starting at or beyond it
+    """
+    before: List[Run] = []
+    beyond: List[Run] = []
+    for offset, blocks in runs:
+        count = min(blocks, max(0, -(-(size - offset) // block_size)))
+        if count:
+            before.append((offset, count))
+        if count < blocks:
+            beyond.append((offset + count * block_size, blocks - count))
+    return before, beyond
+
+
+def iter_offsets(runs: Iterable[Run], block_size: int) -> Iterator[int]:
+    for offset, blocks in runs:
+        yield from range(offset, offset + blocks * block_size, block_size)
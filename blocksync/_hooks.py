@@ -12,11 +12,13 @@ class Hooks:
         on_after: Optional[Callable[[Status], Any]],
         monitor: Optional[Callable[[Status], Any]],
         on_error: Optional[Callable[[Exception, Status], Any]],
+        on_converge: Optional[Callable[[Status], Any]] = None,
     ):
         self.before: Optional[Callable[..., Any]] = on_before
         self.after: Optional[Callable[[Status], Any]] = on_after
         self.monitor: Optional[Callable[[Status], Any]] = monitor
         self.on_error: Optional[Callable[[Exception, Status], Any]] = on_error
+        self.converge: Optional[Callable[[Status], Any]] = on_converge
 
     def _run(self, hook: Optional[Callable], *args, **kwargs):
         if hook:
@@ -33,3 +35,6 @@ class Hooks:
 
     def run_on_error(self, exc: Exception, status: Status):
         self._run(self.on_error, exc, status)
+
+    def run_converge(self, status: Status):
+        self._run(self.converge, status)
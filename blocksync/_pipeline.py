@@ -0,0 +1,179 @@
+import os
+import queue
+import threading
+from typing import IO, Callable, Generator, Iterable, List, Optional, Tuple
+
+from blocksync._consts import CHUNK_SIZE
+
+__all__ = ["BlockHasher", "Chunk", "get_chunk_size", "read_blocks", "read_range"]
+
+# offset, content, digest of the block (on its last chunk when hashing), whether the chunk ends the block
+Chunk = Tuple[int, memoryview, Optional[bytes], bool]
+
+
+def get_chunk_size(block_size: int) -> int:
+    """
+    Blocks larger than CHUNK_SIZE are read, hashed and sent in pieces so memory does not grow with the block size
+    """
+    return min(block_size, CHUNK_SIZE)
+
+
+class BlockHasher:
+    """
+    Hash a stream of consecutive bytes into the digests of its block_size blocks
+    """
+
+    def __init__(self, block_size: int, hash_: Callable):
+        self.block_size: int = block_size
+        self.hash_: Callable = hash_
+        self._hash = hash_()
+        self._size: int = 0
+
+    def update(self, data: bytes) -> List[bytes]:
+        """
+        Return the digests of the blocks completed by data
+        """
+        digests: List[bytes] = []
+        view = memoryview(data)
+        while view:
+            size = min(len(view), self.block_size - self._size)
+            self._hash.update(view[:size])
+            self._size += size
+            view = view[size:]
+            if self._size == self.block_size:
+                digests += self.flush()
+        return digests
+
+    def flush(self) -> List[bytes]:
+        """
+        Return the digest of the partial block at the end of the stream, if any
+        """
+        if not self._size:
+            return []
+        digest = self._hash.digest()
+        self._hash, self._size = self.hash_(), 0
+        return [digest]
+
+
+def _readinto(fd: int, buffer: memoryview, offset: int) -> int:
+    if hasattr(os, "preadv"):
+        return os.preadv(fd, [buffer], offset)
+    data = os.pread(fd, len(buffer), offset)
+    buffer[: len(data)] = data
+    return len(data)
+
+
+def read_range(fileobj: IO, offset: int, length: int, chunk_size: int) -> Generator[memoryview, None, None]:
+    """
+    Yield a byte range in chunks read into a single reusable buffer, leaving the file position alone
+    """
+    buffer = memoryview(bytearray(max(0, min(chunk_size, length))))
+    while 0 < length and (size := _readinto(fileobj.fileno(), buffer[: min(chunk_size, length)], offset)):
+        yield buffer[:size]
+        offset += size
+        length -= size
+
+
+def _iter_chunks(
+    offsets: Iterable[int], block_size: int, chunk_size: int
+) -> Generator[Tuple[int, int, bool], None, None]:
+    for offset in offsets:
+        for chunk_offset in range(offset, offset + block_size, chunk_size):
+            size = min(chunk_size, offset + block_size - chunk_offset)
+            yield chunk_offset, size, chunk_offset + size == offset + block_size
+
+
+def _read_sequential(
+    fileobj: IO, offsets: Iterable[int], block_size: int, chunk_size: int, hash_: Optional[Callable]
+) -> Generator[Chunk, None, None]:
+    block_hash = hash_() if hash_ else None
+    first = True
+    for offset, size, end in _iter_chunks(offsets, block_size, chunk_size):
+        # Seek every time, the caller may write through the same file object between blocks
+        fileobj.seek(offset)
+        chunk = fileobj.read(size)
+        if not chunk and first:
+            break
+        first = end = end or len(chunk) < size
+        digest = None
+        if hash_ is not None and block_hash is not None:
+            block_hash.update(chunk)
+            if end:
+                digest, block_hash = block_hash.digest(), hash_()
+        yield offset, memoryview(chunk), digest, end
+
+
+def _read_ahead(
+    fileobj: IO, offsets: Iterable[int], block_size: int, chunk_size: int, depth: int, hash_: Optional[Callable]
+) -> Generator[Chunk, None, None]:
+    fd = fileobj.fileno()
+    free: queue.Queue = queue.Queue()
+    for _ in range(depth):
+        free.put(bytearray(chunk_size))
+    read_queue: queue.Queue = queue.Queue()
+    hashed_queue: queue.Queue = queue.Queue()
+
+    def read():
+        try:
+            first = True
+            for offset, size, end in _iter_chunks(offsets, block_size, chunk_size):
+                if (buffer := free.get()) is None:
+                    break
+                read_size = _readinto(fd, memoryview(buffer)[:size], offset)
+                if not read_size and first:
+                    break
+                first = end = end or read_size < size
+                read_queue.put((offset, buffer, read_size, end))
+        except Exception as e:
+            read_queue.put(e)
+        read_queue.put(None)
+
+    def hash_blocks():
+        block_hash = hash_() if hash_ else None
+        while isinstance(item := read_queue.get(), tuple):
+            offset, buffer, size, end = item
+            digest = None
+            if hash_ is not None and block_hash is not None:
+                block_hash.update(memoryview(buffer)[:size])
+                if end:
+                    digest, block_hash = block_hash.digest(), hash_()
+            hashed_queue.put((offset, buffer, size, digest, end))
+        hashed_queue.put(item)
+
+    threads = [threading.Thread(target=read, daemon=True), threading.Thread(target=hash_blocks, daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while isinstance(item := hashed_queue.get(), tuple):
+            offset, buffer, size, digest, end = item
+            yield offset, memoryview(buffer)[:size], digest, end
+            free.put(buffer)
+        if isinstance(item, Exception):
+            raise item
+    finally:
+        # Wake the reader up if it is waiting for a free buffer
+        free.put(None)
+        for thread in threads:
+            thread.join()
+
+
+def read_blocks(
+    fileobj: IO,
+    offsets: Iterable[int],
+    block_size: int,
+    depth: int = 0,
+    hash_: Optional[Callable] = None,
+) -> Generator[Chunk, None, None]:
+    """
+    Yield the chunks of the blocks at the ascending offsets, stopping at the end of the file.
+    Each item holds the offset and content of a chunk, the block digest on the last chunk of a block
+    when hash_ is given, and whether the chunk ends its block. Blocks up to CHUNK_SIZE are a single chunk.
+
+    With a depth, chunks are read and hashed ahead by background threads into a pool of depth reusable
+    buffers, so disk I/O and hashing overlap the caller's transfer while memory stays capped at
+    depth * CHUNK_SIZE. A yielded chunk is only valid until the next one is requested.
+    """
+    chunk_size = get_chunk_size(block_size)
+    if depth > 0:
+        return _read_ahead(fileobj, offsets, block_size, chunk_size, depth, hash_)
+    return _read_sequential(fileobj, offsets, block_size, chunk_size, hash_)
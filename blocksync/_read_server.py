@@ -1,29 +1,229 @@
+import collections
 import hashlib
 import io
+import json
+import os
+import queue
 import sys
-from typing import Callable
+import threading
+from typing import IO, Any, Callable, Deque, Generator, Iterable, List, Optional, Tuple
 
 DIFF = b"2"
+END = b"4"
 COMPLEN = len(DIFF)
-path: bytes = sys.stdin.buffer.readline().strip()
-stdout = sys.stdout.buffer
-stdin = sys.stdin.buffer
+# Blocks larger than this are hashed in pieces and read again when they are sent
+CHUNK_SIZE = 8 << 20
 
-fileobj = open(path, "rb")
-fileobj.seek(io.SEEK_SET, io.SEEK_END)
-print(fileobj.tell(), flush=True)
+# offset, length, content (None for blocks larger than CHUNK_SIZE), digest
+Block = Tuple[int, int, Optional[bytes], bytes]
 
-block_size: int = int(stdin.readline())
-hash_: Callable = getattr(hashlib, stdin.readline().strip().decode())
-startpos: int = int(stdin.readline())
-maxblock: int = int(stdin.readline())
 
-with fileobj:
-    fileobj.seek(startpos)
+class BlockHasher:
+    """
+    Hash a stream of consecutive bytes into the digests of its block_size blocks
+    """
+
+    def __init__(self, block_size: int, hash_: Callable):
+        self.block_size = block_size
+        self.hash_ = hash_
+        self._hash = hash_()
+        self._size = 0
+
+    def update(self, data: bytes) -> List[bytes]:
+        digests: List[bytes] = []
+        view = memoryview(data)
+        while view:
+            size = min(len(view), self.block_size - self._size)
+            self._hash.update(view[:size])
+            self._size += size
+            view = view[size:]
+            if self._size == self.block_size:
+                digests += self.flush()
+        return digests
+
+    def flush(self) -> List[bytes]:
+        if not self._size:
+            return []
+        digest = self._hash.digest()
+        self._hash, self._size = self.hash_(), 0
+        return [digest]
+
+
+def get_offsets(runs: List[List[int]], block_size: int):
+    for offset, blocks in runs:
+        yield from range(offset, offset + blocks * block_size, block_size)
+
+
+def read_block(fileobj: IO[bytes], offset: int, block_size: int, hash_: Callable) -> Block:
+    # Positional reads do not share the file position with the read-ahead thread
+    if block_size <= CHUNK_SIZE:
+        block = os.pread(fileobj.fileno(), block_size, offset)
+        return offset, len(block), block, hash_(block).digest()
+    block_hash, length = hash_(), 0
+    while length < block_size and (
+        chunk := os.pread(fileobj.fileno(), min(CHUNK_SIZE, block_size - length), offset + length)
+    ):
+        block_hash.update(chunk)
+        length += len(chunk)
+    return offset, length, None, block_hash.digest()
+
+
+def read_sequential(fileobj: IO[bytes], offsets: Iterable[int], block_size: int, hash_: Callable):
+    for offset in offsets:
+        yield read_block(fileobj, offset, block_size, hash_)
+
+
+def read_ahead(fileobj: IO[bytes], offsets: Iterable[int], block_size: int, hash_: Callable, depth: int, count: int):
+    """
+    Read and hash the blocks in a background thread, holding at most depth blocks that were not consumed yet
+    """
+    blocks: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def read():
+        try:
+            for offset in offsets:
+                if stop.is_set():
+                    break
+                blocks.put(read_block(fileobj, offset, block_size, hash_))
+        except Exception as e:
+            # Raised by the consumer instead of leaving it waiting for blocks that never come
+            blocks.put(e)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        for _ in range(count):
+            if isinstance(item := blocks.get(), Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting for room in the queue
+        while thread.is_alive():
+            try:
+                blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def main(stdin: IO[bytes], stdout: IO[bytes], sendfile: Optional[Callable[[IO[bytes], int, int], Any]] = None):
+    path: bytes = stdin.readline().strip()
+
+    try:
+        fileobj = open(path, "rb")
+    except FileNotFoundError:
+        # A destination that does not exist yet is empty
+        stdout.write(b"0\n")
+        stdout.flush()
+        return
+    fileobj.seek(io.SEEK_SET, io.SEEK_END)
+    stdout.write(f"{fileobj.tell()}\n".encode())
+    stdout.flush()
+
+    header = stdin.readline().strip()
+    if not header:
+        # Only the size was requested
+        fileobj.close()
+        return
+    block_size: int = int(header)
+    hash_: Callable = getattr(hashlib, stdin.readline().strip().decode())
+    startpos: int = int(stdin.readline())
+    maxblock: int = int(stdin.readline())
+    options = json.loads(stdin.readline())
+    # Only the given runs of blocks are read when syncing extents
+    runs: List[List[int]] = options.get("runs", [[startpos, maxblock]])
+    maxblock = sum(blocks for _, blocks in runs)
+    offsets = get_offsets(runs, block_size)
+    # Without acks only the digests are streamed
+    ack: bool = options.get("ack", True)
+    window: int = max(1, options.get("window", 1))
+    depth: int = options.get("depth", 0)
+    # Byte ranges the client does not have at all, streamed without acks after the blocks
+    tail: List[List[int]] = options.get("tail", [])
+    tail_hash: Optional[Callable] = hash_ if options.get("verify") else None
+    chunk_size: int = options.get("chunk_size", max(1, CHUNK_SIZE // block_size) * block_size)
+
+    with fileobj:
+        if depth > 0:
+            blocks = read_ahead(fileobj, offsets, block_size, hash_, depth, maxblock)
+        else:
+            blocks = read_sequential(fileobj, offsets, block_size, hash_)
+
+        try:
+            if ack:
+                if not serve_blocks(stdin, stdout, fileobj, blocks, maxblock, window, sendfile):
+                    # The client stopped early and does not want the tail
+                    return
+            else:
+                for _, _, _, digest in blocks:
+                    stdout.write(digest)
+                stdout.flush()
+        finally:
+            blocks.close()
+        for offset, length in tail:
+            hasher = BlockHasher(block_size, tail_hash) if tail_hash else None
+            send_range(stdout, fileobj, offset, length, chunk_size, hasher, sendfile)
+        stdout.flush()
+
+
+def serve_blocks(
+    stdin: IO[bytes],
+    stdout: IO[bytes],
+    fileobj: IO[bytes],
+    blocks: Generator[Block, None, None],
+    maxblock: int,
+    window: int,
+    sendfile: Optional[Callable[[IO[bytes], int, int], Any]],
+) -> bool:
+    """
+    Send the block digests up to window blocks ahead of the acks, and each block the ack asks for.
+    Returns False when the client ended the stream early.
+    """
+    pending: Deque[Tuple[int, int, Optional[bytes]]] = collections.deque()
+    for _, (offset, length, block, digest) in zip(range(min(window, maxblock)), blocks):
+        pending.append((offset, length, block))
+        stdout.write(digest)
+    stdout.flush()
     for _ in range(maxblock):
-        block = fileobj.read(block_size)
-        stdout.write(hash_(block).digest())
+        offset, length, block = pending.popleft()
+        if (operation := stdin.read(COMPLEN)) in (END, b""):
+            return False
+        if operation == DIFF:
+            if block is None or sendfile:
+                send_range(stdout, fileobj, offset, length, CHUNK_SIZE, None, sendfile)
+            else:
+                stdout.write(block)
+        if (item := next(blocks, None)) is not None:
+            pending.append(item[:3])
+            stdout.write(item[3])
         stdout.flush()
-        if stdin.read(COMPLEN) == DIFF:
-            stdout.write(block)
-            stdout.flush()
+    return True
+
+
+def send_range(
+    stdout: IO[bytes],
+    fileobj: IO[bytes],
+    offset: int,
+    length: int,
+    chunk_size: int,
+    hasher: Optional[BlockHasher],
+    sendfile: Optional[Callable[[IO[bytes], int, int], Any]],
+):
+    """
+    Send a byte range in chunks, each followed by the digests of the blocks it completes when a hasher is given
+    """
+    if sendfile and hasher is None:
+        stdout.flush()
+        sendfile(fileobj, offset, length)
+        return
+    while 0 < length and (chunk := os.pread(fileobj.fileno(), min(chunk_size, length), offset)):
+        stdout.write(chunk)
+        offset += len(chunk)
+        length -= len(chunk)
+        if hasher is not None:
+            stdout.write(b"".join(hasher.update(chunk) + (hasher.flush() if length <= 0 else [])))
+
+
+if __name__ == "__main__":
+    main(sys.stdin.buffer, sys.stdout.buffer)
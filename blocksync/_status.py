@@ -1,5 +1,7 @@
+import hashlib
+import multiprocessing
 import threading
-from typing import Literal, TypedDict
+from typing import Dict, Literal, Optional, Tuple, TypedDict
 
 
 class Blocks(TypedDict):
@@ -23,19 +25,112 @@ class Status:
         self.src_size: int = src_size
         self.dest_size: int = dest_size
         self.blocks: Blocks = Blocks(same=0, diff=0, done=0)
+        self.copied_blocks: int = 0
+        # Number of blocks to visit when only some extents are synced
+        self.extent_blocks: Optional[int] = None
+        self.src_digest: Optional[str] = None
+        self.dest_digest: Optional[str] = None
+        self._range_digests: Dict[int, Tuple[bytes, bytes]] = {}
 
     def __repr__(self):
-        return str({k: v for k, v in self.__dict__.items() if k != "_lock"})
+        return str({k: v for k, v in self.__dict__.items() if not k.startswith("_")})
 
-    def add_block(self, block_type: Literal["same", "diff"]):
+    def add_block(self, block_type: Literal["same", "diff", "copy"], count: int = 1):
         with self._lock:
-            self.blocks[block_type] += 1
+            if block_type == "copy":
+                # A differing block that was copied from elsewhere in the destination
+                self.copied_blocks += count
+                block_type = "diff"
+            self.blocks[block_type] += count
             self.blocks["done"] = self.blocks["same"] + self.blocks["diff"]
 
     @property
     def rate(self) -> float:
         return (
-            min(100.00, (self.blocks["done"] / (self.src_size // self.block_size)) * 100)
+            min(100.00, (self.blocks["done"] / (self.extent_blocks or self.src_size // self.block_size)) * 100)
             if self.blocks["done"] > 1
             else 0.00
         )
+
+    def add_digests(self, worker_id: int, hash_name: str, src_digest: bytes, dest_digest: bytes):
+        """
+        Record the digests of a finished worker range, the image digests are the hash
+        of all range digests in worker order once every worker has reported
+        """
+        with self._lock:
+            self._range_digests[worker_id] = (src_digest, dest_digest)
+            if len(self._range_digests) == self.workers:
+                ranges = [self._range_digests[i] for i in sorted(self._range_digests)]
+                self.src_digest = hashlib.new(hash_name, b"".join(src for src, _ in ranges)).hexdigest()
+                self.dest_digest = hashlib.new(hash_name, b"".join(dest for _, dest in ranges)).hexdigest()
+
+    @property
+    def verified(self) -> Optional[bool]:
+        if self.src_digest is None:
+            return None
+        return self.src_digest == self.dest_digest
+
+
+class SharedStatus(Status):
+    """
+    Status whose block counters live in shared memory, so worker processes report progress through it.
+    Each worker process only updates its own slot, which needs no lock, and the counters are summed when read.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        block_size: int,
+        src_size: int,
+        dest_size: int = 0,
+    ):
+        # same, diff and copied blocks of the parent process (slot 0) and of each worker
+        self._counters = multiprocessing.RawArray("q", 3 * (workers + 1))
+        self._slot: int = 0
+        super().__init__(workers, block_size, src_size, dest_size)
+
+    def __repr__(self):
+        return str(
+            {
+                **{k: v for k, v in self.__dict__.items() if not k.startswith("_")},
+                "blocks": self.blocks,
+                "copied_blocks": self.copied_blocks,
+            }
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _set_worker(self, worker_id: int):
+        self._slot = 3 * worker_id
+
+    @property
+    def blocks(self) -> Blocks:
+        same, diff = sum(self._counters[0::3]), sum(self._counters[1::3])
+        return Blocks(same=same, diff=diff, done=same + diff)
+
+    @blocks.setter
+    def blocks(self, blocks: Blocks):
+        # Assigning replaces the totals
+        self._counters[0::3] = [blocks["same"]] + [0] * self.workers
+        self._counters[1::3] = [blocks["diff"]] + [0] * self.workers
+
+    @property
+    def copied_blocks(self) -> int:
+        return sum(self._counters[2::3])
+
+    @copied_blocks.setter
+    def copied_blocks(self, copied_blocks: int):
+        self._counters[2::3] = [copied_blocks] + [0] * self.workers
+
+    def add_block(self, block_type: Literal["same", "diff", "copy"], count: int = 1):
+        if block_type == "copy":
+            self._counters[self._slot + 2] += count
+            block_type = "diff"
+        self._counters[self._slot + (block_type == "diff")] += count
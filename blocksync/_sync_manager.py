@@ -1,3 +1,4 @@
+import multiprocessing
 import threading
 from typing import List
 
@@ -39,3 +40,42 @@ class SyncManager:
             if worker.is_alive():
                 return False
         return True
+
+
+class ProcessSyncManager(SyncManager):
+    """
+    SyncManager whose suspend and cancel requests reach worker processes.
+    The flags checked on every block are plain shared memory, the event is only waited on while suspended.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._suspended = multiprocessing.RawValue("b", 0)
+        self._canceled = multiprocessing.RawValue("b", 0)
+        self._suspend = multiprocessing.Event()  # type: ignore[assignment]
+        self._suspend.set()
+
+    def __getstate__(self):
+        # The worker processes do not need the threads supervising them
+        state = self.__dict__.copy()
+        state["workers"] = []
+        return state
+
+    def cancel_sync(self):
+        self._canceled.value = 1
+
+    def suspend(self):
+        self._suspended.value = 1
+        self._suspend.clear()
+
+    def resume(self):
+        self._suspended.value = 0
+        self._suspend.set()
+
+    @property
+    def canceled(self) -> bool:
+        return bool(self._canceled.value)
+
+    @property
+    def suspended(self) -> bool:
+        return bool(self._suspended.value)
@@ -0,0 +1,300 @@
+import abc
+import fcntl
+import functools
+import hashlib
+import io
+import os
+import shlex
+import socket
+import ssl
+import subprocess
+import sys
+import uuid
+from typing import IO, TYPE_CHECKING, List, Optional, Tuple, Union, cast
+
+from blocksync._consts import DEFAULT_DAEMON_PORT, ByteSizes
+
+if TYPE_CHECKING:
+    import paramiko
+
+__all__ = [
+    "Transport",
+    "ParamikoTransport",
+    "SubprocessTransport",
+    "LocalTransport",
+    "OpenSSHTransport",
+    "TCPTransport",
+    "get_transport",
+]
+
+REMOTE_CACHE_DIR = ".cache/blocksync"
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+TCP_ROLES = {"_read_server.py": "read", "_write_server.py": "write"}
+
+
+class Transport(abc.ABC):
+    """
+    Runs the server scripts on the other host and exposes their stdin/stdout as binary file objects
+    """
+
+    @abc.abstractmethod
+    def server_command(self, script_path: str) -> str:
+        pass
+
+    @abc.abstractmethod
+    def exec_command(self, command: str) -> Tuple[IO[bytes], IO[bytes]]:
+        pass
+
+    def close(self):
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def _get_script_digest(script_path: str) -> str:
+    with open(script_path, "rb") as fileobj:
+        return hashlib.sha256(fileobj.read()).hexdigest()
+
+
+def _read_script(script_path: str) -> str:
+    with open(script_path, "r") as fileobj:
+        return fileobj.read()
+
+
+def _connect_ssh(
+    allow_load_system_host_keys: bool = True,
+    compress: bool = True,
+    **ssh_config,
+) -> "paramiko.SSHClient":
+    import paramiko
+
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+    if allow_load_system_host_keys:
+        ssh.load_system_host_keys()
+    ssh.connect(**ssh_config, compress=compress)
+    return ssh
+
+
+def _makedirs_sftp(sftp: "paramiko.SFTPClient", path: str):
+    current = ""
+    for part in path.split("/"):
+        current = f"{current}/{part}" if current else part
+        try:
+            sftp.stat(current)
+        except IOError:
+            sftp.mkdir(current)
+
+
+def _deploy_server_script(ssh: "paramiko.SSHClient", script_path: str) -> str:
+    """
+    Install the server script into a per-user cache directory keyed by its content,
+    uploading it only when the installed copy is missing or does not match.
+    Returns the command that runs the installed script.
+    """
+    digest = _get_script_digest(script_path)
+    remote_dir = f"{REMOTE_CACHE_DIR}/{digest[:16]}"
+    remote_path = f"{remote_dir}/{os.path.basename(script_path)}"
+    sftp = ssh.open_sftp()
+    try:
+        try:
+            with sftp.open(remote_path, "rb") as fileobj:
+                installed_digest = hashlib.sha256(fileobj.read()).hexdigest()
+        except IOError:
+            installed_digest = None
+        if installed_digest != digest:
+            _makedirs_sftp(sftp, remote_dir)
+            # Uploaded beside the final path and renamed into place, concurrent syncs never run a partial script
+            tmp_path = f"{remote_path}.{uuid.uuid4().hex}.tmp"
+            sftp.put(script_path, tmp_path)
+            sftp.posix_rename(tmp_path, remote_path)
+    finally:
+        sftp.close()
+    return f"python3 {remote_path}"
+
+
+def _set_pipe_size(fileobj: IO, size: int):
+    try:
+        fcntl.fcntl(fileobj.fileno(), F_SETPIPE_SZ, size)
+    except OSError:
+        pass
+
+
+class ParamikoTransport(Transport):
+    def __init__(self, allow_load_system_host_keys: bool = True, compress: bool = True, **ssh_config):
+        self.ssh: "paramiko.SSHClient" = _connect_ssh(allow_load_system_host_keys, compress, **ssh_config)
+
+    def server_command(self, script_path: str) -> str:
+        return _deploy_server_script(self.ssh, script_path)
+
+    def exec_command(self, command: str) -> Tuple[IO[bytes], IO[bytes]]:
+        stdin, stdout, _ = self.ssh.exec_command(command)
+        return cast(IO[bytes], stdin), cast(IO[bytes], stdout)
+
+    def close(self):
+        self.ssh.close()
+
+
+class SubprocessTransport(Transport):
+    """
+    Runs the server scripts as child processes connected through large pipes
+    """
+
+    buffer_size: int = ByteSizes.MiB
+
+    def __init__(self):
+        self.processes: List[subprocess.Popen] = []
+
+    @abc.abstractmethod
+    def _get_args(self, command: str) -> List[str]:
+        pass
+
+    def exec_command(self, command: str) -> Tuple[IO[bytes], IO[bytes]]:
+        # Reap the servers of previous syncs, the engines close their pipes but not the transport
+        self.processes = [process for process in self.processes if process.poll() is None]
+        process = subprocess.Popen(
+            self._get_args(command),
+            bufsize=self.buffer_size,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        stdin, stdout = cast(IO[bytes], process.stdin), cast(IO[bytes], process.stdout)
+        _set_pipe_size(stdin, self.buffer_size)
+        _set_pipe_size(stdout, self.buffer_size)
+        self.processes.append(process)
+        return stdin, stdout
+
+    def close(self):
+        for process in self.processes:
+            process.wait()
+        self.processes.clear()
+
+
+class LocalTransport(SubprocessTransport):
+    """
+    Runs the server scripts on this host, mainly as a stand-in for a remote host in tests
+    """
+
+    def server_command(self, script_path: str) -> str:
+        return f"{shlex.quote(sys.executable)} {shlex.quote(script_path)}"
+
+    def _get_args(self, command: str) -> List[str]:
+        return shlex.split(command)
+
+
+class OpenSSHTransport(SubprocessTransport):
+    """
+    Runs the server scripts through the system ssh binary, sharing a single connection via ControlMaster
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: Optional[int] = None,
+        username: Optional[str] = None,
+        key_filename: Optional[Union[str, List[str]]] = None,
+        compress: bool = True,
+        ssh_options: Optional[List[str]] = None,
+        ssh_command: str = "ssh",
+        control_persist: int = 60,
+    ):
+        super().__init__()
+        self.args: List[str] = [
+            ssh_command,
+            "-o",
+            "BatchMode=yes",
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            "ControlPath=~/.ssh/blocksync-%C",
+            "-o",
+            f"ControlPersist={control_persist}",
+        ]
+        if compress:
+            self.args.append("-C")
+        if port is not None:
+            self.args += ["-p", str(port)]
+        if username is not None:
+            self.args += ["-l", username]
+        for key in [key_filename] if isinstance(key_filename, str) else key_filename or []:
+            self.args += ["-i", key]
+        self.args += ssh_options or []
+        self.args.append(hostname)
+
+    def server_command(self, script_path: str) -> str:
+        # The script is sent on the command line because stdin carries the sync protocol
+        return f"python3 -c {shlex.quote(_read_script(script_path))}"
+
+    def _get_args(self, command: str) -> List[str]:
+        return [*self.args, command]
+
+
+class _SocketWriter(io.BufferedWriter):
+    def __init__(self, sock: socket.socket, buffer_size: int):
+        super().__init__(sock.makefile("wb", buffering=0), buffer_size)
+        self._sock = sock
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            # Half-close so the server sees EOF, TLS cannot be half-closed without tearing down the session
+            if not isinstance(self._sock, ssl.SSLSocket):
+                self._sock.shutdown(socket.SHUT_WR)
+        super().close()
+
+
+class TCPTransport(Transport):
+    """
+    Talks to a blocksync daemon over plain TCP, optionally with TLS and/or a pre-shared HMAC key
+    """
+
+    buffer_size: int = ByteSizes.MiB
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int = DEFAULT_DAEMON_PORT,
+        secret: Optional[Union[str, bytes]] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.hostname: str = hostname
+        self.port: int = port
+        self.secret: Optional[bytes] = secret.encode() if isinstance(secret, str) else secret
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.timeout: Optional[float] = timeout
+
+    def server_command(self, script_path: str) -> str:
+        return TCP_ROLES[os.path.basename(script_path)]
+
+    def exec_command(self, command: str) -> Tuple[IO[bytes], IO[bytes]]:
+        from blocksync.daemon import answer_challenge, set_socket_options
+
+        sock = socket.create_connection((self.hostname, self.port), timeout=self.timeout)
+        set_socket_options(sock)
+        if self.ssl_context is not None:
+            sock = self.ssl_context.wrap_socket(sock, server_hostname=self.hostname)
+        stdin = cast(IO[bytes], _SocketWriter(sock, self.buffer_size))
+        stdout = cast(IO[bytes], sock.makefile("rb", buffering=self.buffer_size))
+        # The socket is closed once both files are closed
+        sock.close()
+        if self.secret is not None:
+            answer_challenge(stdin, stdout, self.secret)
+        stdin.write(f"{command}\n".encode())
+        return stdin, stdout
+
+
+def get_transport(
+    transport: Union[str, Transport],
+    allow_load_system_host_keys: bool = True,
+    compress: bool = True,
+    **ssh_config,
+) -> Transport:
+    if isinstance(transport, Transport):
+        return transport
+    if transport == "paramiko":
+        return ParamikoTransport(allow_load_system_host_keys, compress, **ssh_config)
+    if transport == "openssh":
+        return OpenSSHTransport(compress=compress, **ssh_config)
+    if transport == "tcp":
+        return TCPTransport(**ssh_config)
+    raise ValueError(f"Unknown transport: {transport}")
@@ -1,25 +1,160 @@
-import io
+import hashlib
+import json
 import sys
+from typing import IO, Any, Callable, Generator, Iterable, List, Optional
 
+SKIP = b"1"
 DIFF = b"2"
+COPY = b"3"
+END = b"4"
 COMPLEN = len(DIFF)
-stdin = sys.stdin.buffer
-
-path = stdin.readline().strip()
-
-size = int(stdin.readline())
-if size > 0:
-    with open(path, "a+") as fileobj:
-        fileobj.truncate(size)
-
-block_size = int(stdin.readline())
-startpos = int(stdin.readline())
-maxblock = int(stdin.readline())
-
-with open(path, mode="rb+") as f:
-    f.seek(startpos)
-    for _ in range(maxblock):
-        if stdin.read(COMPLEN) == DIFF:
-            f.write(stdin.read(block_size))
-        else:
-            f.seek(block_size, io.SEEK_CUR)
+# Blocks larger than this are received and written in pieces
+CHUNK_SIZE = 8 << 20
+
+
+class BlockHasher:
+    """
+    Hash a stream of consecutive bytes into the digests of its block_size blocks
+    """
+
+    def __init__(self, block_size: int, hash_: Callable):
+        self.block_size = block_size
+        self.hash_ = hash_
+        self._hash = hash_()
+        self._size = 0
+
+    def update(self, data: bytes) -> List[bytes]:
+        digests: List[bytes] = []
+        view = memoryview(data)
+        while view:
+            size = min(len(view), self.block_size - self._size)
+            self._hash.update(view[:size])
+            self._size += size
+            view = view[size:]
+            if self._size == self.block_size:
+                digests += self.flush()
+        return digests
+
+    def flush(self) -> List[bytes]:
+        if not self._size:
+            return []
+        digest = self._hash.digest()
+        self._hash, self._size = self.hash_(), 0
+        return [digest]
+
+
+def read_payload(stdin: IO[bytes], length: int, chunk_size: int) -> Generator[bytes, None, None]:
+    while 0 < length and (chunk := stdin.read(min(chunk_size, length))):
+        length -= len(chunk)
+        yield chunk
+
+
+def copy_chunks(f: IO[bytes], offset: int, length: int, chunk_size: int) -> Generator[bytes, None, None]:
+    for chunk_offset in range(offset, offset + length, chunk_size):
+        f.seek(chunk_offset)
+        if not (chunk := f.read(min(chunk_size, offset + length - chunk_offset))):
+            break
+        yield chunk
+
+
+def write_chunks(f: IO[bytes], offset: int, chunks: Iterable[bytes], hash_: Optional[Callable]) -> Optional[bytes]:
+    block_hash = hash_() if hash_ else None
+    for chunk in chunks:
+        f.seek(offset)
+        f.write(chunk)
+        offset += len(chunk)
+        if block_hash is not None:
+            block_hash.update(chunk)
+    return block_hash.digest() if block_hash is not None else None
+
+
+def write_runs(
+    stdin: IO[bytes], f: IO[bytes], runs: List[List[int]], block_size: int, hash_: Optional[Callable], digest: Any
+) -> bool:
+    """
+    Write the blocks of the runs, returning False when the stream was ended early.
+    Differing blocks are followed by their length and content, copied blocks by the offset to copy from.
+    """
+    chunk_size = min(block_size, CHUNK_SIZE)
+    for run_offset, blocks in runs:
+        for offset in range(run_offset, run_offset + blocks * block_size, block_size):
+            operation = stdin.read(COMPLEN)
+            if operation == DIFF:
+                chunks = read_payload(stdin, int(stdin.readline()), chunk_size)
+            elif operation == COPY:
+                # Copy the block from another offset of the destination
+                chunks = copy_chunks(f, int(stdin.readline()), block_size, chunk_size)
+            elif operation == SKIP:
+                if digest is not None:
+                    digest.update(stdin.read(digest.digest_size))
+                continue
+            else:
+                return False
+            block_digest = write_chunks(f, offset, chunks, hash_)
+            if digest is not None and block_digest is not None:
+                digest.update(block_digest)
+    return True
+
+
+def write_tail(
+    stdin: IO[bytes], f: IO[bytes], tail: List[List[int]], block_size: int, hash_: Optional[Callable], digest: Any
+) -> bool:
+    """
+    Write the tail ranges from the chunks sent for them, returning False when the stream was ended early
+    """
+    for offset, length in tail:
+        end = offset + length
+        hasher = BlockHasher(block_size, hash_) if hash_ else None
+        while offset < end:
+            if stdin.read(COMPLEN) != DIFF:
+                return False
+            size = int(stdin.readline())
+            for chunk in read_payload(stdin, size, CHUNK_SIZE):
+                f.seek(offset)
+                f.write(chunk)
+                offset += len(chunk)
+                if hasher is not None:
+                    digest.update(b"".join(hasher.update(chunk)))
+        if hasher is not None:
+            digest.update(b"".join(hasher.flush()))
+    return True
+
+
+def main(stdin: IO[bytes], stdout: IO[bytes]):
+    path = stdin.readline().strip()
+
+    size = int(stdin.readline())
+    if size > 0:
+        with open(path, "a+") as fileobj:
+            fileobj.truncate(size)
+
+    header = stdin.readline().strip()
+    if not header:
+        # Only creating the destination was requested
+        return
+    block_size = int(header)
+    startpos = int(stdin.readline())
+    maxblock = int(stdin.readline())
+    options = json.loads(stdin.readline())
+    # Only the given runs of blocks are written when syncing extents
+    runs: List[List[int]] = options.get("runs", [[startpos, maxblock]])
+    # Byte ranges beyond the end of the destination, sent in chunks after the blocks
+    tail: List[List[int]] = options.get("tail", [])
+
+    # When verifying, skipped blocks are followed by their digest and written blocks are hashed here
+    verify = options.get("verify")
+    hash_: Optional[Callable] = getattr(hashlib, verify) if verify else None
+    digest = hash_() if hash_ else None
+
+    with open(path, mode="rb+") as f:
+        finished = write_runs(stdin, f, runs, block_size, hash_, digest) and write_tail(
+            stdin, f, tail, block_size, hash_, digest
+        )
+
+    if digest is not None and finished:
+        stdout.write(f"{digest.hexdigest()}\n".encode())
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main(sys.stdin.buffer, sys.stdout.buffer)
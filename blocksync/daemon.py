@@ -0,0 +1,162 @@
+import argparse
+import hmac
+import logging
+import os
+import socket
+import socketserver
+import ssl
+from typing import IO, Optional, cast
+
+from blocksync import _read_server, _write_server
+from blocksync._consts import CHUNK_SIZE, DEFAULT_DAEMON_PORT, ByteSizes
+
+__all__ = ["serve", "make_server", "make_ssl_context", "authenticate", "answer_challenge"]
+
+CHALLENGE_SIZE = 32
+SOCKET_BUFFER_SIZE = 4 * ByteSizes.MiB
+
+logger = logging.getLogger("blocksync.daemon")
+
+
+def authenticate(stdin: IO[bytes], stdout: IO[bytes], secret: bytes) -> bool:
+    """
+    Server side of the pre-shared key handshake: send a random challenge and check its HMAC
+    """
+    challenge = os.urandom(CHALLENGE_SIZE)
+    stdout.write(challenge)
+    stdout.flush()
+    expected = hmac.new(secret, challenge, "sha256").digest()
+    return hmac.compare_digest(stdin.read(len(expected)), expected)
+
+
+def answer_challenge(stdin: IO[bytes], stdout: IO[bytes], secret: bytes):
+    challenge = stdout.read(CHALLENGE_SIZE)
+    stdin.write(hmac.new(secret, challenge, "sha256").digest())
+
+
+def set_socket_options(sock: socket.socket, buffer_size: int = SOCKET_BUFFER_SIZE):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    rbufsize = ByteSizes.MiB
+    wbufsize = ByteSizes.MiB
+    server: "_Server"
+
+    def setup(self):
+        set_socket_options(self.request)
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        super().setup()
+
+    def sendfile(self, fileobj: IO[bytes], offset: int, count: int):
+        self.wfile.flush()
+        if isinstance(self.connection, ssl.SSLSocket):
+            # Ranges may span the whole device, encrypt them a chunk at a time
+            while 0 < count and (chunk := os.pread(fileobj.fileno(), min(CHUNK_SIZE, count), offset)):
+                self.wfile.write(chunk)
+                offset += len(chunk)
+                count -= len(chunk)
+            return
+        # Unlike socket.sendfile this leaves the file position alone, the read server may be reading ahead
+        while 0 < count and (sent := os.sendfile(self.connection.fileno(), fileobj.fileno(), offset, count)):
+            offset += sent
+            count -= sent
+
+    def handle(self):
+        rfile, wfile = cast(IO[bytes], self.rfile), cast(IO[bytes], self.wfile)
+        if self.server.secret is not None and not authenticate(rfile, wfile, self.server.secret):
+            logger.warning(f"Authentication failed from {self.client_address}")
+            return
+        role = rfile.readline().strip().decode()
+        if role == "read":
+            _read_server.main(rfile, wfile, sendfile=self.sendfile)
+        elif role == "write":
+            _write_server.main(rfile, wfile)
+        else:
+            logger.warning(f"Unknown role {role!r} from {self.client_address}")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, secret: Optional[bytes] = None, ssl_context: Optional[ssl.SSLContext] = None):
+        self.secret: Optional[bytes] = secret
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        super().__init__(address, _Handler)
+
+    def get_request(self):
+        sock, address = super().get_request()
+        if self.ssl_context is not None:
+            # The handshake is done by the handler thread so a slow client cannot block accept()
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+
+def make_server(
+    host: str = "",
+    port: int = DEFAULT_DAEMON_PORT,
+    secret: Optional[bytes] = None,
+    ssl_context: Optional[ssl.SSLContext] = None,
+) -> socketserver.ThreadingTCPServer:
+    # TLS alone only encrypts, clients are authenticated by the secret or by a client certificate
+    if secret is None and (ssl_context is None or ssl_context.verify_mode != ssl.CERT_REQUIRED):
+        logger.warning("Serving without client authentication, only use this on a trusted network")
+    return _Server((host, port), secret=secret, ssl_context=ssl_context)
+
+
+def make_ssl_context(certfile: str, keyfile: Optional[str] = None, cafile: Optional[str] = None) -> ssl.SSLContext:
+    """
+    Server TLS context, requiring client certificates signed by cafile when it is given
+    """
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH, cafile=cafile)
+    ssl_context.load_cert_chain(certfile, keyfile)
+    if cafile is not None:
+        ssl_context.verify_mode = ssl.CERT_REQUIRED
+    return ssl_context
+
+
+def serve(
+    host: str = "",
+    port: int = DEFAULT_DAEMON_PORT,
+    secret: Optional[bytes] = None,
+    ssl_context: Optional[ssl.SSLContext] = None,
+):
+    with make_server(host, port, secret, ssl_context) as server:
+        logger.info(f"Listening on {host or '*'}:{port}")
+        server.serve_forever()
+
+
+def _read_secret(path: str) -> bytes:
+    with open(path, "rb") as fileobj:
+        return fileobj.read().strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve blocksync read/write servers over TCP")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=DEFAULT_DAEMON_PORT)
+    parser.add_argument("--secret-file", help="file containing the pre-shared key for HMAC authentication")
+    parser.add_argument("--certfile", help="serve TLS with this certificate chain")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--cafile", help="require TLS client certificates signed by these CA certificates")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.cafile and not args.certfile:
+        parser.error("--cafile requires --certfile")
+    ssl_context = make_ssl_context(args.certfile, args.keyfile, args.cafile) if args.certfile else None
+    serve(
+        args.host,
+        args.port,
+        secret=_read_secret(args.secret_file) if args.secret_file else None,
+        ssl_context=ssl_context,
+    )
+
+
+if __name__ == "__main__":
+    main()
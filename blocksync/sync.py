@@ -1,18 +1,26 @@
+import collections
+import functools
 import hashlib
 import io
+import json
 import logging
+import multiprocessing
+import os
 import threading
 import time
 import timeit
 from math import ceil
-from typing import IO, Any, Callable, Dict, Generator, Optional, Tuple, Union
+from typing import IO, Any, Callable, Deque, Dict, Generator, Iterable, Iterator, List, Optional, Tuple, Union
 
-import paramiko
-
-from blocksync._consts import BASE_DIR, DIFF, SKIP, ByteSizes
+from blocksync._consts import BASE_DIR, CHUNK_SIZE, COPY, DIFF, END, SKIP, ByteSizes
+from blocksync._converge import Converger, get_dirty_blocks
+from blocksync._dedup import DedupIndex
+from blocksync._extents import Extent, Run, get_runs, iter_offsets, load_extents, split_runs
 from blocksync._hooks import Hooks
-from blocksync._status import Status
-from blocksync._sync_manager import SyncManager
+from blocksync._pipeline import BlockHasher, Chunk, get_chunk_size, read_blocks, read_range
+from blocksync._status import SharedStatus, Status
+from blocksync._sync_manager import ProcessSyncManager, SyncManager
+from blocksync._transport import Transport, get_transport
 
 __all__ = ["local_to_local", "local_to_remote", "remote_to_local"]
 
@@ -40,6 +48,31 @@ def _get_range(worker_id: int, status: Status) -> Tuple[int, int]:
     return start, ceil(chunk_size / status.block_size)
 
 
+def _get_runs(worker_id: int, status: Status, extents: Optional[List[Extent]]) -> List[Run]:
+    startpos, maxblock = _get_range(worker_id, status)
+    if extents is None:
+        return [(startpos, maxblock)]
+    return get_runs(extents, startpos, maxblock, status.block_size)
+
+
+def _load_extents(
+    status: Status,
+    extents: Optional[Union[str, Iterable[Extent], Callable[[int], Iterable[Extent]]]],
+    extents_bitmap: Optional[str],
+    extent_granularity: Optional[Union[str, int]],
+) -> Optional[List[Extent]]:
+    if callable(extents):
+        # Extents that depend on the source size, which is only known here for remote sources
+        extents = extents(status.src_size)
+    granularity = _get_block_size(extent_granularity) if extent_granularity is not None else None
+    loaded = load_extents(extents, extents_bitmap, granularity, status.block_size)
+    if loaded is not None:
+        status.extent_blocks = sum(
+            blocks for worker_id in range(1, status.workers + 1) for _, blocks in _get_runs(worker_id, status, loaded)
+        )
+    return loaded
+
+
 def _get_size(path: str) -> int:
     fileobj = open(path, "r")
     fileobj.seek(io.SEEK_SET, io.SEEK_END)
@@ -48,10 +81,19 @@ def _get_size(path: str) -> int:
     return size
 
 
-def _get_remotedev_size(ssh: paramiko.SSHClient, command: str, path: str) -> int:
-    stdin, stdout, _ = ssh.exec_command(command)
+def _get_dest_size(path: str, create_dest: bool) -> int:
+    # Only a destination that is about to be created may be missing
+    if create_dest and not os.path.exists(path):
+        return 0
+    return _get_size(path)
+
+
+def _get_remotedev_size(transport: Transport, command: str, path: str) -> int:
+    stdin, stdout = transport.exec_command(command)
     try:
-        stdin.write(f"{path}\n")
+        # Only the size is asked for, the empty header ends the session
+        stdin.write(f"{path}\n\n".encode())
+        stdin.flush()
         return int(stdout.readline())
     finally:
         stdout.close()
@@ -63,26 +105,138 @@ def _do_create(path: str, size: int):
         fileobj.truncate(size)
 
 
+def _do_remote_create(transport: Transport, command: str, path: str, size: int):
+    stdin, stdout = transport.exec_command(command)
+    try:
+        # An empty header ends the session, EOF cannot be sent over TLS
+        stdin.write(f"{path}\n{size}\n\n".encode())
+        stdin.close()
+        # Wait until the write server has resized the file and exited
+        stdout.read()
+    finally:
+        stdout.close()
+        stdin.close()
+
+
+def _prepare_dest(
+    status: Status,
+    dest_size: int,
+    resize: Callable[[int], Any],
+    create_dest: bool,
+    truncate_dest: bool,
+    dryrun: bool,
+):
+    """
+    Record the destination size, then create the destination or shrink it to the source size.
+    A dry run never creates or resizes it.
+    """
+    # Measured before creating the destination, the blocks beyond its end are copied without comparing
+    status.dest_size = dest_size
+    if not dryrun and (create_dest or (truncate_dest and status.src_size < status.dest_size)):
+        resize(status.src_size)
+
+
+def _split_tail(runs: List[Run], status: Status, dryrun: bool) -> Tuple[List[Run], List[Extent]]:
+    """
+    Split off the byte ranges beyond the end of the destination, which are copied without comparing
+    """
+    if dryrun:
+        return runs, []
+    runs, tail_runs = split_runs(runs, status.dest_size, status.block_size)
+    return runs, [
+        (offset, min(offset + blocks * status.block_size, status.src_size) - offset)
+        for offset, blocks in tail_runs
+        if offset < status.src_size
+    ]
+
+
+def _get_tail_chunk_size(block_size: int) -> int:
+    # Whole blocks per chunk unless a block is larger than a chunk
+    return max(1, CHUNK_SIZE // block_size) * block_size if block_size <= CHUNK_SIZE else CHUNK_SIZE
+
+
+def _read_tail(
+    read: Callable[[int, int], bytes], tail: List[Extent], block_size: int, hash_: Optional[Callable]
+) -> Generator[Tuple[int, bytes, int, List[bytes]], None, None]:
+    """
+    Yield the offset and content of the tail chunks returned by read, with the number and
+    (when hash_ is given) the digests of the blocks they complete
+    """
+    chunk_size = _get_tail_chunk_size(block_size)
+    for offset, length in tail:
+        end = offset + length
+        hasher = BlockHasher(block_size, hash_) if hash_ else None
+        for chunk_offset in range(offset, end, chunk_size):
+            chunk_end = min(chunk_offset + chunk_size, end)
+            chunk = read(chunk_offset, chunk_end - chunk_offset)
+            # The last block of a range may be partial
+            blocks = ceil((chunk_end - offset) / block_size) if chunk_end == end else (chunk_end - offset) // block_size
+            blocks -= (chunk_offset - offset) // block_size
+            digests: List[bytes] = []
+            if hasher is not None:
+                digests = hasher.update(chunk) + (hasher.flush() if chunk_end == end else [])
+            yield chunk_offset, chunk, blocks, digests
+
+
+def _pread(fileobj: IO) -> Callable[[int, int], bytes]:
+    return lambda offset, length: os.pread(fileobj.fileno(), length, offset)
+
+
+def _read_stream(stream: IO, length: int, chunk_size: int) -> Generator[bytes, None, None]:
+    for chunk_offset in range(0, length, chunk_size):
+        yield stream.read(min(chunk_size, length - chunk_offset))
+
+
+def _write_chunks(
+    dest: IO, offset: int, chunks: Iterable[Union[bytes, memoryview]], hash_: Optional[Callable] = None
+) -> Optional[bytes]:
+    """
+    Write consecutive chunks from offset, returning the digest of what was written when hash_ is given
+    """
+    written_hash = hash_() if hash_ else None
+    dest.seek(offset)
+    for chunk in chunks:
+        dest.write(chunk)
+        if written_hash is not None:
+            written_hash.update(chunk)
+    return written_hash.digest() if written_hash is not None else None
+
+
+def _next_block_hash(chunks: Iterator[Chunk], default: bytes) -> bytes:
+    """
+    Consume the chunks of the next block and return its digest, or default at the end of the file
+    """
+    for _, _, digest, block_end in chunks:
+        if block_end:
+            return digest or default
+    return default
+
+
 def _get_blocks(fileobj: IO, block_size: int) -> Generator[bytes, None, None]:
     while block := fileobj.read(block_size):
         yield block
 
 
-def _log(worker_id: int, msg: str, level: int = logging.INFO, *args, **kwargs):
-    logger.log(level, f"[Worker {worker_id}]: {msg}", *args, **kwargs)
+def _find_copy(digest: bytes, *indexes: DedupIndex) -> Optional[int]:
+    for index in indexes:
+        if (offset := index.get(digest)) is not None:
+            return offset
+    return None
 
 
-def _connect_ssh(
-    allow_load_system_host_keys: bool = True,
-    compress: bool = True,
-    **ssh_config,
-) -> paramiko.SSHClient:
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy)
-    if allow_load_system_host_keys:
-        ssh.load_system_host_keys()
-    ssh.connect(**ssh_config, compress=compress)
-    return ssh
+def _check_converge_options(converge: bool, dryrun: bool, verify: bool, extents: bool = False, processes: bool = False):
+    if converge and processes:
+        raise ValueError("converge cannot be used with processes")
+    if converge and extents:
+        raise ValueError("converge cannot be used with extents")
+    if converge and dryrun:
+        raise ValueError("converge cannot be used with dryrun")
+    if converge and verify:
+        raise ValueError("converge cannot be used with verify")
+
+
+def _log(worker_id: int, msg: str, level: int = logging.INFO, *args, **kwargs):
+    logger.log(level, f"[Worker {worker_id}]: {msg}", *args, **kwargs)
 
 
 def _sync(
@@ -92,10 +246,14 @@ def _sync(
     sync: Callable,
     sync_options: Dict[str, Any],
     wait: bool = False,
+    processes: bool = False,
 ) -> Tuple[Optional[SyncManager], Status]:
     for i in range(1, workers + 1):
         sync_options["worker_id"] = i
-        worker = threading.Thread(target=sync, kwargs=sync_options)
+        if processes:
+            worker = threading.Thread(target=_supervise_process, args=(sync, dict(sync_options)))
+        else:
+            worker = threading.Thread(target=_run_thread, args=(sync, dict(sync_options)))
         worker.start()
         manager.workers.append(worker)
     if wait:
@@ -104,12 +262,76 @@ def _sync(
     return manager, status
 
 
+def _run_thread(sync: Callable, sync_options: Dict[str, Any]):
+    """
+    Run a worker in a thread, reporting the errors raised outside its sync loop, such as while connecting
+    """
+    try:
+        sync(**sync_options)
+    except Exception as e:
+        # The other workers would wait at the converge barrier forever
+        if (converger := sync_options.get("converger")) is not None:
+            converger.abort()
+        _log(sync_options["worker_id"], msg=str(e), exc_info=True)
+        sync_options["hooks"].run_on_error(e, sync_options["status"])
+
+
+def _supervise_process(sync: Callable, sync_options: Dict[str, Any]):
+    """
+    Run a worker in its own process, running its hooks here since they may not be sent to another process
+    """
+    worker_id: int = sync_options["worker_id"]
+    status: Status = sync_options["status"]
+    hooks: Hooks = sync_options.pop("hooks")
+    context = multiprocessing.get_context()
+    conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_run_process, args=(sync, child_conn, sync_options), daemon=True)
+
+    hooks.run_before()
+    process.start()
+    child_conn.close()
+    while not conn.poll(sync_options["monitoring_interval"]):
+        hooks.run_monitor(status)
+    try:
+        errors, digests = conn.recv()
+    except EOFError:
+        process.join()
+        errors, digests = [ChildProcessError(f"Worker {worker_id} exited with code {process.exitcode}")], None
+    process.join()
+    conn.close()
+    for e in errors:
+        hooks.run_on_error(e, status)
+    if digests is not None:
+        status.add_digests(worker_id, sync_options["hash1"], *digests)
+    hooks.run_after(status)
+
+
+def _run_process(sync: Callable, conn: Any, sync_options: Dict[str, Any]):
+    worker_id: int = sync_options["worker_id"]
+    status: SharedStatus = sync_options["status"]
+    status._set_worker(worker_id)
+    errors: List[Exception] = []
+    try:
+        sync(**sync_options, hooks=Hooks(None, None, None, on_error=lambda e, _: errors.append(e)))
+    except Exception as e:
+        _log(worker_id, msg=str(e), exc_info=True)
+        errors.append(e)
+    result = (errors, status._range_digests.get(worker_id))
+    try:
+        conn.send(result)
+    except Exception:
+        # An error that cannot be pickled is reported by its representation
+        conn.send(([RuntimeError(repr(e)) for e in errors], result[1]))
+    conn.close()
+
+
 def local_to_local(
     src: str,
     dest: str,
     block_size: Union[str, int] = ByteSizes.MiB,
     workers: int = 1,
     create_dest: bool = False,
+    truncate_dest: bool = False,
     wait: bool = False,
     dryrun: bool = False,
     on_before: Optional[Callable[..., Any]] = None,
@@ -118,27 +340,56 @@ def local_to_local(
     on_error: Optional[Callable[[Exception, Status], Any]] = None,
     monitoring_interval: Union[int, float] = 1,
     sync_interval: Union[int, float] = 0,
+    verify: bool = False,
+    hash1: str = "sha256",
+    converge: bool = False,
+    converge_max_dirty_blocks: int = 64,
+    converge_pass_time: Union[int, float] = 1,
+    converge_max_passes: int = 10,
+    on_converge: Optional[Callable[[Status], Any]] = None,
+    pipeline_depth: int = 0,
+    extents: Optional[Union[str, Iterable[Tuple[int, int]], Callable[[int], Iterable[Tuple[int, int]]]]] = None,
+    extents_bitmap: Optional[str] = None,
+    extent_granularity: Optional[Union[str, int]] = None,
+    processes: bool = False,
 ) -> Tuple[Optional[SyncManager], Status]:
-    status = Status(
+    _check_converge_options(converge, dryrun, verify, extents is not None or extents_bitmap is not None, processes)
+    # Worker processes are not bound by the GIL, they report progress through shared memory
+    status = (SharedStatus if processes else Status)(
         workers=workers,
         block_size=_get_block_size(block_size),
         src_size=_get_size(src),
     )
-    if create_dest:
-        _do_create(dest, status.src_size)
-    status.dest_size = _get_size(dest)
-    manager = SyncManager()
+    _prepare_dest(
+        status,
+        _get_dest_size(dest, create_dest and not dryrun),
+        functools.partial(_do_create, dest),
+        create_dest,
+        truncate_dest,
+        dryrun,
+    )
+    manager = ProcessSyncManager() if processes else SyncManager()
+    hooks = Hooks(on_before=on_before, on_after=on_after, monitor=monitor, on_error=on_error, on_converge=on_converge)
     sync_options = {
         "src": src,
         "dest": dest,
         "status": status,
         "manager": manager,
-        "hooks": Hooks(on_before=on_before, on_after=on_after, monitor=monitor, on_error=on_error),
+        "hooks": hooks,
         "dryrun": dryrun,
         "monitoring_interval": monitoring_interval,
         "sync_interval": sync_interval,
+        "verify": verify,
+        "hash1": hash1,
+        "converger": Converger(
+            workers, status, manager, hooks, converge_max_dirty_blocks, converge_pass_time, converge_max_passes
+        )
+        if converge
+        else None,
+        "pipeline_depth": pipeline_depth,
+        "extents": _load_extents(status, extents, extents_bitmap, extent_granularity),
     }
-    return _sync(manager, status, workers, _local_to_local, sync_options, wait)
+    return _sync(manager, status, workers, _local_to_local, sync_options, wait, processes)
 
 
 def _local_to_local(
@@ -151,37 +402,90 @@ def _local_to_local(
     dryrun: bool,
     monitoring_interval: Union[int, float],
     sync_interval: Union[int, float],
+    verify: bool,
+    hash1: str,
+    converger: Optional[Converger],
+    pipeline_depth: int,
+    extents: Optional[List[Extent]],
 ):
+    hash_ = getattr(hashlib, hash1)
+    src_digest, dest_digest = hash_(), hash_()
+    # Source block digests of the previous pass when converging
+    digests = bytearray()
+
     hooks.run_before()
 
-    startpos, maxblock = _get_range(worker_id, status)
-    _log(worker_id, f"Start sync({src} -> {dest}) {maxblock} blocks")
+    startpos, _ = _get_range(worker_id, status)
+    runs = _get_runs(worker_id, status, extents)
+    _log(worker_id, f"Start sync({src} -> {dest}) {sum(blocks for _, blocks in runs)} blocks")
+    runs, tail = _split_tail(runs, status, dryrun)
     srcdev = io.open(src, "rb+")
     destdev = io.open(dest, "rb+")
-    srcdev.seek(startpos)
-    destdev.seek(startpos)
+    src_blocks = read_blocks(
+        srcdev,
+        iter_offsets(runs, status.block_size),
+        status.block_size,
+        pipeline_depth,
+        hash_ if verify or converger is not None else None,
+    )
+    dest_blocks = read_blocks(destdev, iter_offsets(runs, status.block_size), status.block_size, pipeline_depth)
 
     t_last = timeit.default_timer()
+    # Blocks are compared chunk by chunk, only the differing chunks are written
+    block_diff, dest_block_hash = False, hash_()
     try:
-        for src_block, dest_block, _ in zip(
-            _get_blocks(srcdev, status.block_size),
-            _get_blocks(destdev, status.block_size),
-            range(maxblock),
-        ):
+        for offset, src_chunk, src_block_hash, block_end in src_blocks:
             if manager.suspended:
                 _log(worker_id, "Waiting for resume...")
                 manager._wait_resuming()
             if manager.canceled:
                 break
 
-            if src_block != dest_block:
+            # Chunks beyond the end of the destination compare as different and extend it
+            dest_chunk = next(dest_blocks, (offset, b"", None, True))[1][: len(src_chunk)]
+            if src_chunk != dest_chunk:
+                block_diff = True
                 if not dryrun:
-                    destdev.seek(-len(src_block), io.SEEK_CUR)
-                    srcdev.write(src_block)
-                    destdev.flush()
-                status.add_block("diff")
-            else:
-                status.add_block("same")
+                    destdev.seek(offset)
+                    destdev.write(src_chunk)
+            if verify and dryrun:
+                dest_block_hash.update(dest_chunk)
+            if block_end:
+                destdev.flush()
+                status.add_block("diff" if block_diff else "same")
+                if verify:
+                    src_digest.update(src_block_hash)
+                    dest_digest.update(dest_block_hash.digest() if dryrun and block_diff else src_block_hash)
+                if converger is not None:
+                    assert src_block_hash is not None
+                    digests += src_block_hash
+                block_diff, dest_block_hash = False, hash_()
+
+            t_cur = timeit.default_timer()
+            if monitoring_interval <= t_cur - t_last:
+                hooks.run_monitor(status)
+                t_last = t_cur
+            if block_end and 0 < sync_interval:
+                time.sleep(sync_interval)
+
+        for offset, chunk, blocks, src_block_hashes in _read_tail(
+            _pread(srcdev), tail, status.block_size, hash_ if verify or converger is not None else None
+        ):
+            if manager.suspended:
+                _log(worker_id, "Waiting for resume...")
+                manager._wait_resuming()
+            if manager.canceled:
+                break
+
+            destdev.seek(offset)
+            destdev.write(chunk)
+            status.add_block("diff", blocks)
+            for src_block_hash in src_block_hashes:
+                if verify:
+                    src_digest.update(src_block_hash)
+                    dest_digest.update(src_block_hash)
+                if converger is not None:
+                    digests += src_block_hash
 
             t_cur = timeit.default_timer()
             if monitoring_interval <= t_cur - t_last:
@@ -189,10 +493,38 @@ def _local_to_local(
                 t_last = t_cur
             if 0 < sync_interval:
                 time.sleep(sync_interval)
+        destdev.flush()
+
+        while converger is not None and converger.next_pass():
+            dirty_blocks = 0
+            for offset, length in get_dirty_blocks(srcdev, startpos, status.block_size, digests, hash_):
+                if manager.suspended:
+                    _log(worker_id, "Waiting for resume...")
+                    manager._wait_resuming()
+                if manager.canceled:
+                    break
+
+                _write_chunks(destdev, offset, read_range(srcdev, offset, length, CHUNK_SIZE))
+                status.add_block("diff")
+                dirty_blocks += 1
+
+                t_cur = timeit.default_timer()
+                if monitoring_interval <= t_cur - t_last:
+                    hooks.run_monitor(status)
+                    t_last = t_cur
+            destdev.flush()
+            converger.add_dirty_blocks(dirty_blocks)
     except Exception as e:
+        if converger is not None:
+            converger.abort()
         _log(worker_id, msg=str(e), exc_info=True)
         hooks.run_on_error(e, status)
+    else:
+        if verify and not manager.canceled:
+            status.add_digests(worker_id, hash1, src_digest.digest(), dest_digest.digest())
     finally:
+        src_blocks.close()
+        dest_blocks.close()
         srcdev.close()
         destdev.close()
     hooks.run_after(status)
@@ -204,6 +536,7 @@ def local_to_remote(
     block_size: Union[str, int] = ByteSizes.MiB,
     workers: int = 1,
     create_dest: bool = False,
+    truncate_dest: bool = False,
     wait: bool = False,
     dryrun: bool = False,
     on_before: Optional[Callable[..., Any]] = None,
@@ -217,50 +550,76 @@ def local_to_remote(
     write_server_command: Optional[str] = None,
     allow_load_system_host_keys: bool = True,
     compress: bool = True,
+    transport: Union[str, Transport] = "paramiko",
+    verify: bool = False,
+    dedup: bool = False,
+    converge: bool = False,
+    converge_max_dirty_blocks: int = 64,
+    converge_pass_time: Union[int, float] = 1,
+    converge_max_passes: int = 10,
+    on_converge: Optional[Callable[[Status], Any]] = None,
+    pipeline_depth: int = 0,
+    extents: Optional[Union[str, Iterable[Tuple[int, int]], Callable[[int], Iterable[Tuple[int, int]]]]] = None,
+    extents_bitmap: Optional[str] = None,
+    extent_granularity: Optional[Union[str, int]] = None,
     **ssh_config,
 ) -> Tuple[Optional[SyncManager], Status]:
+    _check_converge_options(converge, dryrun, verify, extents is not None or extents_bitmap is not None)
     status: Status = Status(
         workers=workers,
         block_size=_get_block_size(block_size),
         src_size=_get_size(src),
     )
 
-    ssh = _connect_ssh(allow_load_system_host_keys, compress, **ssh_config)
-    if sftp := ssh.open_sftp():
-        if read_server_command is None:
-            sftp.put(DEFAULT_READ_SERVER_SCRIPT_PATH, READ_SERVER_SCRIPT_NAME)
-            read_server_command = f"python3 {READ_SERVER_SCRIPT_NAME}"
-        if write_server_command is None:
-            sftp.put(DEFAULT_WRITE_SERVER_SCRIPT_PATH, WRITE_SERVER_SCRIPT_NAME)
-            write_server_command = f"python3 {WRITE_SERVER_SCRIPT_NAME}"
+    transport = get_transport(transport, allow_load_system_host_keys, compress, **ssh_config)
+    if read_server_command is None:
+        read_server_command = transport.server_command(DEFAULT_READ_SERVER_SCRIPT_PATH)
+    if write_server_command is None:
+        write_server_command = transport.server_command(DEFAULT_WRITE_SERVER_SCRIPT_PATH)
+    _prepare_dest(
+        status,
+        _get_remotedev_size(transport, read_server_command, dest),
+        functools.partial(_do_remote_create, transport, write_server_command, dest),
+        create_dest,
+        truncate_dest,
+        dryrun,
+    )
 
     manager = SyncManager()
+    hooks = Hooks(on_before=on_before, on_after=on_after, monitor=monitor, on_error=on_error, on_converge=on_converge)
     sync_options = {
-        "ssh": ssh,
+        "transport": transport,
         "src": src,
         "dest": dest,
         "status": status,
         "manager": manager,
-        "create_dest": create_dest,
         "dryrun": dryrun,
-        "hooks": Hooks(on_before=on_before, on_after=on_after, monitor=monitor, on_error=on_error),
+        "hooks": hooks,
         "monitoring_interval": monitoring_interval,
         "sync_interval": sync_interval,
         "hash1": hash1,
         "read_server_command": read_server_command,
         "write_server_command": write_server_command,
+        "verify": verify,
+        "dedup_index": DedupIndex() if dedup else None,
+        "converger": Converger(
+            workers, status, manager, hooks, converge_max_dirty_blocks, converge_pass_time, converge_max_passes
+        )
+        if converge
+        else None,
+        "pipeline_depth": pipeline_depth,
+        "extents": _load_extents(status, extents, extents_bitmap, extent_granularity),
     }
     return _sync(manager, status, workers, _local_to_remote, sync_options, wait)
 
 
 def _local_to_remote(
     worker_id: int,
-    ssh: paramiko.SSHClient,
+    transport: Transport,
     src: str,
     dest: str,
     status: Status,
     manager: SyncManager,
-    create_dest: bool,
     dryrun: bool,
     hooks: Hooks,
     monitoring_interval: Union[int, float],
@@ -268,45 +627,111 @@ def _local_to_remote(
     hash1: str,
     read_server_command: str,
     write_server_command: str,
+    verify: bool,
+    dedup_index: Optional[DedupIndex],
+    converger: Optional[Converger],
+    pipeline_depth: int,
+    extents: Optional[List[Extent]],
 ):
     hash_ = getattr(hashlib, hash1)
     hash_len = hash_().digest_size
+    src_digest = hash_()
+    # Blocks written by this worker can only be copied by this worker's write server,
+    # other write servers may not have written them yet
+    written_index = DedupIndex()
+    # The original destination blocks of this worker's range, until this worker overwrites them
+    dest_index = DedupIndex()
+    # Source block digests of the previous pass when converging
+    digests = bytearray()
 
     hooks.run_before()
 
-    reader_stdin, reader_stdout, _ = ssh.exec_command(read_server_command)
-    writer_stdin, writer_stdout, _ = ssh.exec_command(write_server_command)
-    writer_stdin.write(f"{dest}\n{status.src_size if create_dest else 0}\n")
-    reader_stdin.write(f"{dest}\n")
-    status.dest_size = int(reader_stdout.readline())
+    reader_stdin, reader_stdout = transport.exec_command(read_server_command)
+    writer_stdin, writer_stdout = transport.exec_command(write_server_command)
+    writer_stdin.write(f"{dest}\n0\n".encode())
+    reader_stdin.write(f"{dest}\n".encode())
+    reader_stdin.flush()
+    reader_stdout.readline()
     startpos, maxblock = _get_range(worker_id, status)
-    _log(worker_id, f"Start sync({src} -> {dest}) {maxblock} blocks")
-    reader_stdin.write(f"{status.block_size}\n{hash1}\n{startpos}\n{maxblock}\n")
-    writer_stdin.write(f"{status.block_size}\n{startpos}\n{maxblock}\n")
+    runs = _get_runs(worker_id, status, extents)
+    _log(worker_id, f"Start sync({src} -> {dest}) {sum(blocks for _, blocks in runs)} blocks")
+    runs, tail = _split_tail(runs, status, dryrun)
+    # The read server streams the destination digests without waiting for acks
+    reader_options: Dict[str, Any] = {"ack": False, "depth": pipeline_depth, "runs": runs}
+    writer_options: Dict[str, Any] = {"runs": runs, "tail": tail}
+    if verify:
+        writer_options["verify"] = hash1
+    reader_stdin.write(f"{status.block_size}\n{hash1}\n{startpos}\n{maxblock}\n{json.dumps(reader_options)}\n".encode())
+    reader_stdin.flush()
+    writer_stdin.write(f"{status.block_size}\n{startpos}\n{maxblock}\n{json.dumps(writer_options)}\n".encode())
+    dest_block_hashes: Iterator[bytes] = iter(functools.partial(reader_stdout.read, hash_len), b"")
+    if dedup_index is not None:
+        # Index the whole range first so content that sits later in the destination can be copied too
+        range_block_hashes = [reader_stdout.read(hash_len) for _ in iter_offsets(runs, status.block_size)]
+        for offset, digest in zip(iter_offsets(runs, status.block_size), range_block_hashes):
+            # A partial last block cannot be the source of a whole block
+            if offset + status.block_size <= status.dest_size:
+                dest_index.add(digest, offset)
+        dest_block_hashes = iter(range_block_hashes)
 
     t_last = timeit.default_timer()
     with open(src, "rb+") as fileobj:
-        fileobj.seek(startpos)
+        src_blocks = read_blocks(
+            fileobj, iter_offsets(runs, status.block_size), status.block_size, pipeline_depth, hash_
+        )
+        block_offset: Optional[int] = None
         try:
-            for src_block, _ in zip(_get_blocks(fileobj, status.block_size), range(maxblock)):
+            for offset, src_chunk, src_block_hash, block_end in src_blocks:
                 if manager.suspended:
                     _log(worker_id, "Waiting for resume...")
                     manager._wait_resuming()
                 if manager.canceled:
                     break
 
-                src_block_hash: bytes = hash_(src_block).digest()
-                dest_block_hash: bytes = reader_stdout.read(hash_len)
-                reader_stdin.write(SKIP)
-                if src_block_hash != dest_block_hash:
-                    if not dryrun:
-                        writer_stdin.write(DIFF)
-                        writer_stdin.write(src_block)
-                    else:
-                        writer_stdin.write(SKIP)
+                if block_offset is None:
+                    block_offset = offset
+                if not block_end:
+                    # Only blocks larger than a chunk are split, they are read again if they differ
+                    continue
+                # Blocks are always hashed here, the digest comes with their last chunk
+                assert src_block_hash is not None
+                dest_block_hash = next(dest_block_hashes)
+                if src_block_hash == dest_block_hash:
+                    writer_stdin.write(SKIP)
+                    status.add_block("same")
+                    if dedup_index is not None:
+                        dedup_index.add(dest_block_hash, block_offset)
+                elif dryrun:
+                    writer_stdin.write(SKIP)
                     status.add_block("diff")
+                elif (
+                    dedup_index is not None
+                    and (copy_offset := _find_copy(src_block_hash, dedup_index, written_index, dest_index)) is not None
+                ):
+                    writer_stdin.write(COPY + f"{copy_offset}\n".encode())
+                    status.add_block("copy")
+                    written_index.add(src_block_hash, block_offset)
+                    dest_index.discard(dest_block_hash, block_offset)
                 else:
-                    status.add_block("same")
+                    length = offset + len(src_chunk) - block_offset
+                    writer_stdin.write(DIFF + f"{length}\n".encode())
+                    if block_offset == offset:
+                        writer_stdin.write(src_chunk)
+                    else:
+                        for chunk in read_range(fileobj, block_offset, length, CHUNK_SIZE):
+                            writer_stdin.write(chunk)
+                    status.add_block("diff")
+                    if dedup_index is not None:
+                        written_index.add(src_block_hash, block_offset)
+                        dest_index.discard(dest_block_hash, block_offset)
+                block_offset = None
+                if verify:
+                    src_digest.update(src_block_hash)
+                    if dryrun or src_block_hash == dest_block_hash:
+                        # The write server builds the destination digest, forward the digest of the block it keeps
+                        writer_stdin.write(dest_block_hash)
+                if converger is not None:
+                    digests += src_block_hash
 
                 t_cur = timeit.default_timer()
                 if monitoring_interval <= t_cur - t_last:
@@ -314,10 +739,76 @@ def _local_to_remote(
                     t_last = t_cur
                 if 0 < sync_interval:
                     time.sleep(sync_interval)
+
+            for offset, tail_chunk, blocks, src_block_hashes in _read_tail(
+                _pread(fileobj), tail, status.block_size, hash_ if verify or converger is not None else None
+            ):
+                if manager.suspended:
+                    _log(worker_id, "Waiting for resume...")
+                    manager._wait_resuming()
+                if manager.canceled:
+                    break
+
+                writer_stdin.write(DIFF + f"{len(tail_chunk)}\n".encode())
+                writer_stdin.write(tail_chunk)
+                status.add_block("diff", blocks)
+                for src_block_hash in src_block_hashes:
+                    if verify:
+                        src_digest.update(src_block_hash)
+                    if converger is not None:
+                        digests += src_block_hash
+
+                t_cur = timeit.default_timer()
+                if monitoring_interval <= t_cur - t_last:
+                    hooks.run_monitor(status)
+                    t_last = t_cur
+                if 0 < sync_interval:
+                    time.sleep(sync_interval)
+            if not manager.canceled:
+                # Wait until the write server has written everything and exited
+                writer_stdin.close()
+                dest_digest = writer_stdout.read()
+                if verify:
+                    status.add_digests(worker_id, hash1, src_digest.digest(), bytes.fromhex(dest_digest.decode()))
+            else:
+                writer_stdin.write(END)
+
+            while converger is not None and converger.next_pass():
+                writer_stdout.close()
+                writer_stdin, writer_stdout = transport.exec_command(write_server_command)
+                writer_stdin.write(f"{dest}\n0\n{status.block_size}\n{startpos}\n{maxblock}\n{{}}\n".encode())
+                dirty_blocks, next_offset = 0, startpos
+                for offset, length in get_dirty_blocks(fileobj, startpos, status.block_size, digests, hash_):
+                    if manager.suspended:
+                        _log(worker_id, "Waiting for resume...")
+                        manager._wait_resuming()
+                    if manager.canceled:
+                        break
+
+                    writer_stdin.write(SKIP * ((offset - next_offset) // status.block_size))
+                    writer_stdin.write(DIFF + f"{length}\n".encode())
+                    for chunk in read_range(fileobj, offset, length, CHUNK_SIZE):
+                        writer_stdin.write(chunk)
+                    next_offset = offset + status.block_size
+                    status.add_block("diff")
+                    dirty_blocks += 1
+
+                    t_cur = timeit.default_timer()
+                    if monitoring_interval <= t_cur - t_last:
+                        hooks.run_monitor(status)
+                        t_last = t_cur
+                # The write server leaves the remaining blocks alone
+                writer_stdin.write(END)
+                writer_stdin.close()
+                writer_stdout.read()
+                converger.add_dirty_blocks(dirty_blocks)
         except Exception as e:
+            if converger is not None:
+                converger.abort()
             _log(worker_id, msg=str(e), exc_info=True)
             hooks.run_on_error(e, status)
         finally:
+            src_blocks.close()
             reader_stdin.close()
             reader_stdout.close()
             writer_stdin.close()
@@ -331,6 +822,7 @@ def remote_to_local(
     block_size: Union[str, int] = ByteSizes.MiB,
     workers: int = 1,
     create_dest: bool = False,
+    truncate_dest: bool = False,
     wait: bool = False,
     dryrun: bool = False,
     on_before: Optional[Callable[..., Any]] = None,
@@ -343,24 +835,35 @@ def remote_to_local(
     allow_load_system_host_keys: bool = True,
     compress: bool = True,
     read_server_command: Optional[str] = None,
+    transport: Union[str, Transport] = "paramiko",
+    verify: bool = False,
+    dedup: bool = False,
+    pipeline_depth: int = 0,
+    extents: Optional[Union[str, Iterable[Tuple[int, int]], Callable[[int], Iterable[Tuple[int, int]]]]] = None,
+    extents_bitmap: Optional[str] = None,
+    extent_granularity: Optional[Union[str, int]] = None,
     **ssh_config,
 ):
-    ssh = _connect_ssh(allow_load_system_host_keys, compress, **ssh_config)
-    if read_server_command is None and (sftp := ssh.open_sftp()):
-        sftp.put(DEFAULT_READ_SERVER_SCRIPT_PATH, READ_SERVER_SCRIPT_NAME)
-        read_server_command = f"python3 {READ_SERVER_SCRIPT_NAME}"
+    transport = get_transport(transport, allow_load_system_host_keys, compress, **ssh_config)
+    if read_server_command is None:
+        read_server_command = transport.server_command(DEFAULT_READ_SERVER_SCRIPT_PATH)
 
     status = Status(
         workers=workers,
         block_size=ByteSizes.parse_readable_byte_size(block_size) if isinstance(block_size, str) else block_size,
-        src_size=_get_remotedev_size(ssh, read_server_command, src),  # type: ignore[arg-type]
+        src_size=_get_remotedev_size(transport, read_server_command, src),
+    )
+    _prepare_dest(
+        status,
+        _get_dest_size(dest, create_dest and not dryrun),
+        functools.partial(_do_create, dest),
+        create_dest,
+        truncate_dest,
+        dryrun,
     )
-    if create_dest:
-        _do_create(dest, status.src_size)
-    status.dest_size = _get_size(dest)
     manager = SyncManager()
     sync_options = {
-        "ssh": ssh,
+        "transport": transport,
         "src": src,
         "dest": dest,
         "status": status,
@@ -371,13 +874,17 @@ def remote_to_local(
         "sync_interval": sync_interval,
         "hash1": hash1,
         "read_server_command": read_server_command,
+        "verify": verify,
+        "dedup_index": DedupIndex() if dedup else None,
+        "pipeline_depth": pipeline_depth,
+        "extents": _load_extents(status, extents, extents_bitmap, extent_granularity),
     }
     return _sync(manager, status, workers, _remote_to_local, sync_options, wait)
 
 
 def _remote_to_local(
     worker_id: int,
-    ssh: paramiko.SSHClient,
+    transport: Transport,
     src: str,
     dest: str,
     status: Status,
@@ -388,46 +895,126 @@ def _remote_to_local(
     hash1: str,
     read_server_command: str,
     hooks: Hooks,
+    verify: bool,
+    dedup_index: Optional[DedupIndex],
+    pipeline_depth: int,
+    extents: Optional[List[Extent]],
 ):
     hash_ = getattr(hashlib, hash1)
     hash_len = hash_().digest_size
+    src_digest, dest_digest = hash_(), hash_()
+    # The read server sends the source digests up to window blocks ahead of the acks
+    window = max(1, pipeline_depth)
+    src_block_hashes: Deque[bytes] = collections.deque()
+    received = 0
 
     hooks.run_before()
 
-    reader_stdin, *_ = ssh.exec_command(read_server_command)
-    reader_stdout = reader_stdin.channel.makefile("rb")
-    reader_stdin.write(f"{src}\n")
+    reader_stdin, reader_stdout = transport.exec_command(read_server_command)
+    reader_stdin.write(f"{src}\n".encode())
+    reader_stdin.flush()
     reader_stdout.readline()
     startpos, maxblock = _get_range(worker_id, status)
-    _log(worker_id, f"Start sync({src} -> {dest}) {maxblock} blocks")
-    reader_stdin.write(f"{status.block_size}\n{hash1}\n{startpos}\n{maxblock}\n")
+    runs = _get_runs(worker_id, status, extents)
+    _log(worker_id, f"Start sync({src} -> {dest}) {sum(run_blocks for _, run_blocks in runs)} blocks")
+    runs, tail = _split_tail(runs, status, dryrun)
+    blocks = sum(run_blocks for _, run_blocks in runs)
+    # The read server streams the tail after the blocks, followed by the digests of its blocks when verifying
+    reader_options: Dict[str, Any] = {
+        "window": window,
+        "depth": pipeline_depth,
+        "runs": runs,
+        "tail": tail,
+        "chunk_size": _get_tail_chunk_size(status.block_size),
+    }
+    if verify:
+        reader_options["verify"] = True
+    reader_stdin.write(f"{status.block_size}\n{hash1}\n{startpos}\n{maxblock}\n{json.dumps(reader_options)}\n".encode())
+    reader_stdin.flush()
 
     t_last = timeit.default_timer()
     with open(dest, "rb+") as fileobj:
-        fileobj.seek(startpos)
+        dest_blocks = read_blocks(
+            fileobj, iter_offsets(runs, status.block_size), status.block_size, pipeline_depth, hash_
+        )
+        empty_block_hash: bytes = hash_(b"").digest()
         try:
-            for dest_block, _ in zip(_get_blocks(fileobj, status.block_size), range(maxblock)):
+            for i, offset in enumerate(iter_offsets(runs, status.block_size)):
                 if manager.suspended:
                     _log(worker_id, "Waiting for resume...")
                     manager._wait_resuming()
                 if manager.canceled:
                     break
 
-                src_block_hash: bytes = reader_stdout.read(hash_len)
-                dest_block_hash: bytes = hash_(dest_block).digest()
-                if src_block_hash != dest_block_hash:
-                    if not dryrun:
-                        reader_stdin.write(DIFF)
-                        src_block = reader_stdout.read(status.block_size)
-                        fileobj.seek(-len(src_block), io.SEEK_CUR)
-                        fileobj.write(src_block)
-                        fileobj.flush()
-                    else:
-                        reader_stdin.write(SKIP)
-                    status.add_block("diff")
-                else:
+                dest_block_hash = _next_block_hash(dest_blocks, empty_block_hash)
+                if not src_block_hashes:
+                    reader_stdin.flush()
+                    src_block_hashes.append(reader_stdout.read(hash_len))
+                    received += 1
+                src_block_hash: bytes = src_block_hashes.popleft()
+                if src_block_hash == dest_block_hash:
                     reader_stdin.write(SKIP)
                     status.add_block("same")
+                    if dedup_index is not None:
+                        dedup_index.add(dest_block_hash, offset)
+                elif dryrun:
+                    reader_stdin.write(SKIP)
+                    status.add_block("diff")
+                else:
+                    length = max(0, min(status.block_size, status.src_size - offset))
+                    if dedup_index is not None and (copy_offset := dedup_index.get(src_block_hash)) is not None:
+                        reader_stdin.write(SKIP)
+                        chunks: Iterable[Union[bytes, memoryview]] = read_range(
+                            fileobj, copy_offset, length, CHUNK_SIZE
+                        )
+                        status.add_block("copy")
+                    else:
+                        reader_stdin.write(DIFF)
+                        reader_stdin.flush()
+                        # The digests sent ahead of this block come first
+                        while received < min(i + window, blocks):
+                            src_block_hashes.append(reader_stdout.read(hash_len))
+                            received += 1
+                        chunks = _read_stream(reader_stdout, length, get_chunk_size(status.block_size))
+                        status.add_block("diff")
+                    written_hash = _write_chunks(fileobj, offset, chunks, hash_ if verify else None)
+                    fileobj.flush()
+                    if dedup_index is not None:
+                        dedup_index.add(src_block_hash, offset)
+                    if written_hash is not None:
+                        dest_block_hash = written_hash
+                if verify:
+                    src_digest.update(src_block_hash)
+                    dest_digest.update(dest_block_hash)
+
+                t_cur = timeit.default_timer()
+                if monitoring_interval <= t_cur - t_last:
+                    hooks.run_monitor(status)
+                    t_last = t_cur
+                if 0 < sync_interval:
+                    time.sleep(sync_interval)
+
+            if manager.canceled:
+                # The read server may still be waiting for acks, stop it rather than waiting for the tail
+                reader_stdin.write(END)
+                tail = []
+            reader_stdin.flush()
+            for offset, chunk, tail_blocks, dest_block_hashes in _read_tail(
+                lambda _, length: reader_stdout.read(length), tail, status.block_size, hash_ if verify else None
+            ):
+                if manager.suspended:
+                    _log(worker_id, "Waiting for resume...")
+                    manager._wait_resuming()
+                if manager.canceled:
+                    break
+
+                fileobj.seek(offset)
+                fileobj.write(chunk)
+                status.add_block("diff", tail_blocks)
+                if verify:
+                    # The read server follows each chunk with the digests of the blocks it completes
+                    src_digest.update(reader_stdout.read(hash_len * len(dest_block_hashes)))
+                    dest_digest.update(b"".join(dest_block_hashes))
 
                 t_cur = timeit.default_timer()
                 if monitoring_interval <= t_cur - t_last:
@@ -435,10 +1022,15 @@ def _remote_to_local(
                     t_last = t_cur
                 if 0 < sync_interval:
                     time.sleep(sync_interval)
+            fileobj.flush()
         except Exception as e:
             _log(worker_id, msg=str(e), exc_info=True)
             hooks.run_on_error(e, status)
+        else:
+            if verify and not manager.canceled:
+                status.add_digests(worker_id, hash1, src_digest.digest(), dest_digest.digest())
         finally:
+            dest_blocks.close()
             reader_stdin.close()
             reader_stdout.close()
         hooks.run_after(status)
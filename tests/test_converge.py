@@ -0,0 +1,49 @@
+import hashlib
+from unittest.mock import Mock
+
+from blocksync._converge import Converger, get_dirty_blocks
+from blocksync._sync_manager import SyncManager
+
+
+def test_get_dirty_blocks(pytester):
+    digests = bytearray(hashlib.sha256(b"aaaa").digest() + hashlib.sha256(b"bbbb").digest())
+    path = pytester.path / "src.img"
+    path.write_bytes(b"aaaacccc")
+    with open(path, "rb") as fileobj:
+        assert list(get_dirty_blocks(fileobj, 0, 4, digests, hashlib.sha256)) == [(4, 4)]
+
+        # Expect: Record the new digests
+        assert list(get_dirty_blocks(fileobj, 0, 4, digests, hashlib.sha256)) == []
+
+
+def test_converger(fake_status):
+    hooks = Mock()
+    converger = Converger(1, fake_status, SyncManager(), hooks, 1, 0, 10)
+
+    # Expect: Keep passing while the dirty set is large and passes are slow
+    converger.add_dirty_blocks(10)
+    assert converger.next_pass()
+    assert not converger.final
+    hooks.run_converge.assert_not_called()
+
+    # Expect: Run the converge hook and a last pass once the dirty set is small enough
+    converger.add_dirty_blocks(1)
+    assert converger.next_pass()
+    assert converger.final
+    hooks.run_converge.assert_called_once_with(fake_status)
+
+    assert not converger.next_pass()
+    assert converger.passes == 3
+
+
+def test_converger_max_passes(fake_status):
+    converger = Converger(1, fake_status, SyncManager(), Mock(), 0, 0, 2)
+    converger.add_dirty_blocks(10)
+    assert converger.next_pass()
+    assert converger.final
+
+
+def test_converger_abort(fake_status):
+    converger = Converger(2, fake_status, SyncManager(), Mock(), 0, 0, 2)
+    converger.abort()
+    assert not converger.next_pass()
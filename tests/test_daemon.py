@@ -0,0 +1,192 @@
+import io
+import os
+import shutil
+import ssl
+import subprocess
+import threading
+
+import pytest
+
+from blocksync._transport import TCPTransport
+from blocksync.daemon import answer_challenge, authenticate, make_server, make_ssl_context
+from blocksync.sync import local_to_remote, remote_to_local
+
+
+@pytest.fixture
+def daemon():
+    server = make_server("127.0.0.1", 0, secret=b"secret")
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture(scope="session")
+def certificate(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is not available")
+    path = tmp_path_factory.mktemp("tls")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=127.0.0.1",
+            "-addext",
+            "subjectAltName=IP:127.0.0.1",
+            "-keyout",
+            str(path / "key.pem"),
+            "-out",
+            str(path / "cert.pem"),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return path / "cert.pem", path / "key.pem"
+
+
+@pytest.fixture
+def tls_daemon(certificate):
+    # The self-signed certificate is also the client certificate and its own CA
+    ssl_context = make_ssl_context(str(certificate[0]), str(certificate[1]), cafile=str(certificate[0]))
+    server = make_server("127.0.0.1", 0, ssl_context=ssl_context)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def tls_transport(tls_daemon, certificate):
+    ssl_context = ssl.create_default_context(cafile=str(certificate[0]))
+    ssl_context.load_cert_chain(*certificate)
+    return TCPTransport("127.0.0.1", tls_daemon.server_address[1], ssl_context=ssl_context, timeout=10)
+
+
+def test_authenticate(mocker):
+    mocker.patch("blocksync.daemon.os.urandom", return_value=b"c" * 32)
+    response = io.BytesIO()
+    answer_challenge(response, io.BytesIO(b"c" * 32), b"secret")
+    assert authenticate(io.BytesIO(response.getvalue()), io.BytesIO(), b"secret")
+    assert not authenticate(io.BytesIO(response.getvalue()), io.BytesIO(), b"wrong")
+
+
+@pytest.mark.enable_socket
+def test_local_to_remote(daemon, pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(b"x" * len(source_content))
+    _, status = local_to_remote(
+        str(source_file),
+        str(dest),
+        block_size=4,
+        workers=2,
+        wait=True,
+        transport="tcp",
+        hostname="127.0.0.1",
+        port=daemon.server_address[1],
+        secret="secret",
+    )
+    assert dest.read_bytes() == source_content
+    assert status.blocks["diff"] == 4
+
+
+@pytest.mark.enable_socket
+def test_remote_to_local(daemon, pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(b"x" * len(source_content))
+    transport = TCPTransport("127.0.0.1", daemon.server_address[1], secret=b"secret")
+    _, status = remote_to_local(str(source_file), str(dest), block_size=4, workers=2, wait=True, transport=transport)
+    assert dest.read_bytes() == source_content
+    assert status.blocks["diff"] == 4
+
+
+@pytest.mark.enable_socket
+def test_remote_to_local_pipeline(daemon, pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    # The blocks beyond the destination are sent as a tail
+    dest.write_bytes(b"x" * 6)
+    transport = TCPTransport("127.0.0.1", daemon.server_address[1], secret=b"secret")
+    _, status = remote_to_local(
+        str(source_file), str(dest), block_size=4, workers=2, wait=True, transport=transport, pipeline_depth=2
+    )
+    assert dest.read_bytes() == source_content
+    assert status.blocks["diff"] == 4
+
+
+@pytest.mark.enable_socket
+def test_wrong_secret(daemon):
+    transport = TCPTransport("127.0.0.1", daemon.server_address[1], secret=b"wrong")
+    stdin, stdout = transport.exec_command("read")
+    stdin.flush()
+    assert stdout.read() == b""
+    stdin.close()
+    stdout.close()
+
+
+@pytest.mark.enable_socket
+def test_tls(tls_transport, pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    for sync in (local_to_remote, remote_to_local):
+        # The last block is partial and differs, nothing waits for an EOF that TLS never sends
+        dest.write_bytes(source_content[:12] + b"xx")
+        _, status = sync(
+            str(source_file), str(dest), block_size=4, workers=2, wait=True, verify=True, transport=tls_transport
+        )
+        assert dest.read_bytes() == source_content
+        assert status.blocks == {"same": 3, "diff": 1, "done": 4}
+        assert status.verified
+
+
+@pytest.mark.enable_socket
+def test_tls_create_dest(tls_transport, pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    local_to_remote(str(source_file), str(dest), block_size=4, wait=True, create_dest=True, transport=tls_transport)
+    assert dest.read_bytes() == source_content
+
+
+@pytest.mark.enable_socket
+def test_tls_without_client_certificate(tls_daemon, certificate):
+    ssl_context = ssl.create_default_context(cafile=str(certificate[0]))
+    transport = TCPTransport("127.0.0.1", tls_daemon.server_address[1], ssl_context=ssl_context, timeout=10)
+    # Expect: The daemon refuses clients without a certificate
+    with pytest.raises(ssl.SSLError):
+        stdin, stdout = transport.exec_command("read")
+        stdin.write(b"missing.img\n\n")
+        stdin.flush()
+        stdout.read()
+
+
+@pytest.mark.enable_socket
+def test_make_server_warning(caplog, certificate):
+    for ssl_context, warned in (
+        (None, True),
+        (make_ssl_context(str(certificate[0]), str(certificate[1])), True),
+        (make_ssl_context(str(certificate[0]), str(certificate[1]), cafile=str(certificate[0])), False),
+    ):
+        caplog.clear()
+        make_server("127.0.0.1", 0, ssl_context=ssl_context).server_close()
+        # Expect: Warn unless clients are authenticated by a secret or a certificate
+        assert ("without client authentication" in caplog.text) is warned
+
+
+@pytest.mark.enable_socket
+def test_tls_tail_in_chunks(mocker, tls_transport, pytester, source_file, source_content):
+    mocker.patch("blocksync.daemon.CHUNK_SIZE", 3)
+    daemon_os = mocker.patch("blocksync.daemon.os", wraps=os)
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(b"")
+    remote_to_local(str(source_file), str(dest), block_size=4, wait=True, transport=tls_transport)
+    assert dest.read_bytes() == source_content
+    # Expect: The tail is read and encrypted a chunk at a time rather than all at once
+    assert daemon_os.pread.call_count == 5
+    assert all(c.args[1] <= 3 for c in daemon_os.pread.call_args_list)
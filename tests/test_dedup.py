@@ -0,0 +1,18 @@
+from blocksync._dedup import DedupIndex
+
+
+def test_dedup_index():
+    index = DedupIndex()
+    assert index.get(b"digest") is None
+
+    index.add(b"a" * 32, 0)
+    # Expect: Keep the first offset of a digest
+    index.add(b"a" * 32, 10)
+    assert index.get(b"a" * 32) == 0
+    assert len(index) == 1
+
+    # Expect: Only forget the digest if it still maps to the overwritten offset
+    index.discard(b"a" * 32, 10)
+    assert index.get(b"a" * 32) == 0
+    index.discard(b"a" * 32, 0)
+    assert index.get(b"a" * 32) is None
@@ -0,0 +1,79 @@
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple, cast
+
+import pytest
+
+from blocksync._estimate import Estimate, estimate, sample_blocks
+from blocksync._status import Status
+from blocksync._transport import LocalTransport
+from blocksync.sync import local_to_local, remote_to_local
+
+
+def test_sample_blocks():
+    rng = random.Random(0)
+    # Expect: One block within each stratum
+    assert [index // 10 for index in sample_blocks(100, 10, "stratified", rng)] == list(range(10))
+    indexes = sample_blocks(100, 10, "random", rng)
+    assert len(set(indexes)) == 10 and indexes == sorted(indexes)
+    # Expect: Never more samples than blocks
+    assert sample_blocks(3, 10, "random", rng) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        sample_blocks(100, 10, cast(Any, "unknown"))
+
+
+def test_estimate_interval():
+    status = Status(workers=1, block_size=10, src_size=10_000)
+    status.add_block("diff", 20)
+    status.add_block("same", 80)
+    result = Estimate(status, total_blocks=1_000, confidence=0.95, elapsed=1, bandwidth=100)
+    assert result.diff_ratio == 0.2
+    assert result.diff_ratio_low < 0.2 < result.diff_ratio_high
+    assert result.bytes_to_transfer == 2_000
+    # Expect: Scan time scaled to every block plus the transfer time
+    assert result.projected_duration == 10 + 20
+
+    # Expect: Exact when every block was sampled
+    result = Estimate(status, total_blocks=100, confidence=0.95, elapsed=1)
+    assert result.diff_ratio_low == result.diff_ratio == result.diff_ratio_high == 0.2
+
+
+def test_estimate(pytester):
+    src = pytester.path / "src.img"
+    dest = pytester.path / "dest.img"
+    src.write_bytes(b"a" * 400)
+    dest.write_bytes(b"a" * 200 + b"b" * 200)
+    engines: List[Tuple[Callable, Dict[str, Any]]] = [
+        (local_to_local, {}),
+        (remote_to_local, {"transport": LocalTransport()}),
+    ]
+    for sync, options in engines:
+        result = estimate(sync, str(src), str(dest), samples=10, block_size=4, seed=0, **options)
+        assert result.total_blocks == 100
+        assert result.sampled_blocks == 10
+        # Expect: Stratified samples split evenly between the halves
+        assert result.diff_ratio == 0.5
+        # Expect: Nothing is written
+        assert dest.read_bytes() == b"a" * 200 + b"b" * 200
+
+
+def test_estimate_without_setup_time(pytester):
+    src = pytester.path / "src.img"
+    src.write_bytes(b"a" * 400)
+
+    def slow_sync(*args, **kwargs):
+        # Stands for connecting and deploying the servers
+        time.sleep(1)
+        return local_to_local(*args, **kwargs)
+
+    result = estimate(slow_sync, str(src), str(src), samples=10, block_size=4)
+    # Expect: Only the time spent comparing blocks is projected
+    assert result.elapsed < 0.5
+
+
+def test_estimate_workers(pytester):
+    src = pytester.path / "src.img"
+    src.write_bytes(b"a" * 400)
+    result = estimate(local_to_local, str(src), str(src), samples=50, block_size=4, seed=0, workers=3)
+    # Expect: Each sampled block is compared once whatever the number of workers
+    assert result.sampled_blocks == 50
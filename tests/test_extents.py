@@ -0,0 +1,54 @@
+from blocksync._extents import (
+    get_runs,
+    iter_offsets,
+    load_extents,
+    merge_extents,
+    read_bitmap,
+    read_extent_list,
+    split_runs,
+)
+
+
+def test_read_extent_list(pytester):
+    path = pytester.makefile(".txt", "# changed\n0 2\n\n10,4\n")
+    assert read_extent_list(str(path)) == [(0, 2), (10, 4)]
+    assert read_extent_list(str(path), granularity=512) == [(0, 1024), (5120, 2048)]
+
+
+def test_read_extent_list_dm_era(pytester):
+    path = pytester.makefile(".xml", '<blocks>\n  <range begin="0" end="16"/>\n  <block block="20"/>\n</blocks>\n')
+    assert read_extent_list(str(path), granularity=2) == [(0, 32), (40, 2)]
+
+
+def test_read_bitmap(pytester):
+    path = pytester.path / "bitmap"
+    path.write_bytes(bytes([0b00000110, 0x00, 0xFF, 0b10000000]))
+    assert read_bitmap(str(path), granularity=4) == [(4, 8), (64, 32), (124, 4)]
+
+
+def test_merge_extents():
+    # Expect: Sort, merge overlapping and adjacent extents and drop empty ones
+    assert merge_extents([(10, 5), (0, 4), (2, 4), (6, 4), (20, 0)]) == [(0, 15)]
+
+
+def test_load_extents(pytester):
+    assert load_extents(None, None, None, 4) is None
+    assert load_extents([(1, 1)], None, 4, 4) == [(4, 4)]
+    bitmap = pytester.path / "bitmap"
+    bitmap.write_bytes(bytes([0b00000001]))
+    # Expect: Bitmap bits are blocks by default
+    assert load_extents([(8, 2)], str(bitmap), None, 4) == [(0, 4), (8, 2)]
+
+
+def test_get_runs():
+    extents = [(0, 1), (3, 2), (9, 1), (30, 10)]
+    # Expect: Blocks are relative to the worker range and clipped to it
+    assert get_runs(extents, 2, 4, 4) == [(2, 2)]
+    assert get_runs(extents, 0, 10, 4) == [(0, 3), (28, 3)]
+    assert list(iter_offsets([(2, 2), (14, 1)], 4)) == [2, 6, 14]
+
+
+def test_split_runs():
+    # Expect: A block straddling the size stays before it
+    assert split_runs([(0, 3), (20, 2)], 6, 4) == ([(0, 2)], [(8, 1), (20, 2)])
+    assert split_runs([(0, 3)], 0, 4) == ([], [(0, 3)])
@@ -29,3 +29,10 @@ def test_run_on_error(stub_hooks, fake_status):
     exc = Exception()
     stub_hooks.run_on_error(exc, fake_status)
     stub_hooks.on_error.assert_called_once_with(exc, fake_status)
+
+
+def test_run_converge(fake_status):
+    on_converge = Mock()
+    hooks = Hooks(None, None, None, None, on_converge=on_converge)
+    hooks.run_converge(fake_status)
+    on_converge.assert_called_once_with(fake_status)
@@ -0,0 +1,69 @@
+from hashlib import sha256
+
+import pytest
+
+from blocksync._pipeline import BlockHasher, read_blocks, read_range
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_read_blocks(source_file, source_content, depth):
+    with open(source_file, "rb") as fileobj:
+        blocks = [
+            (offset, bytes(block), digest, end)
+            for offset, block, digest, end in read_blocks(fileobj, range(4, 44, 4), 4, depth, sha256)
+        ]
+    expected = [source_content[i : i + 4] for i in range(4, len(source_content), 4)]
+    assert [offset for offset, _, _, _ in blocks] == list(range(4, len(source_content), 4))
+    assert [block for _, block, _, _ in blocks] == expected
+    assert [digest for _, _, digest, _ in blocks] == [sha256(block).digest() for block in expected]
+    assert all(end for _, _, _, end in blocks)
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_read_blocks_in_chunks(mocker, source_file, source_content, depth):
+    mocker.patch("blocksync._pipeline.CHUNK_SIZE", 3)
+    with open(source_file, "rb") as fileobj:
+        chunks = [
+            (offset, bytes(chunk), digest, end)
+            for offset, chunk, digest, end in read_blocks(fileobj, [0, 8], 8, depth, sha256)
+        ]
+    # Expect: Blocks larger than a chunk are split, the digest comes with the last chunk of a block
+    assert chunks == [
+        (0, source_content[0:3], None, False),
+        (3, source_content[3:6], None, False),
+        (6, source_content[6:8], sha256(source_content[0:8]).digest(), True),
+        (8, source_content[8:11], None, False),
+        (11, source_content[11:14], None, False),
+        (14, source_content[14:16], sha256(source_content[8:16]).digest(), True),
+    ]
+
+
+def test_read_blocks_without_hash(source_file):
+    with open(source_file, "rb") as fileobj:
+        assert all(digest is None for _, _, digest, _ in read_blocks(fileobj, [0, 4], 4, 2))
+
+
+def test_read_blocks_close_early(source_file, source_content):
+    with open(source_file, "rb") as fileobj:
+        blocks = read_blocks(fileobj, range(len(source_content)), 1, 1)
+        assert bytes(next(blocks)[1]) == source_content[:1]
+        # Expect: The reader threads stop without consuming the remaining blocks
+        blocks.close()
+
+
+def test_read_range(source_file, source_content):
+    with open(source_file, "rb") as fileobj:
+        assert [bytes(chunk) for chunk in read_range(fileobj, 2, 7, 3)] == [
+            source_content[2:5],
+            source_content[5:8],
+            source_content[8:9],
+        ]
+
+
+def test_block_hasher():
+    hasher = BlockHasher(4, sha256)
+    assert hasher.update(b"aa") == []
+    assert hasher.update(b"aabbbbc") == [sha256(b"aaaa").digest(), sha256(b"bbbb").digest()]
+    # Expect: The partial block at the end is hashed on flush
+    assert hasher.flush() == [sha256(b"c").digest()]
+    assert hasher.flush() == []
@@ -1,24 +1,109 @@
+import io
 import subprocess
 from hashlib import sha256
 
+import pytest
+
 from blocksync._consts import BASE_DIR
+from blocksync._read_server import read_ahead, read_block
 
 
-def test_read_server(source_file, source_content, pytester):
-    p = pytester.popen(
+@pytest.fixture
+def read_server(pytester):
+    return pytester.popen(
         ["python", (BASE_DIR / "_read_server.py")],
         bufsize=0,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
     )
-    stdin, stdout = p.stdin, p.stdout
+
+
+def test_read_server(source_file, source_content, read_server):
+    stdin, stdout = read_server.stdin, read_server.stdout
     stdin.write(f"{source_file}\n".encode())
     assert int(stdout.readline()) == len(source_content)
 
-    stdin.write(f"{len(source_content)}\nsha256\n0\n1\n".encode())
+    stdin.write(f"{len(source_content)}\nsha256\n0\n1\n{{}}\n".encode())
     hashed = sha256(source_content)
     digest = stdout.read(hashed.digest_size)
     assert digest == hashed.digest()
 
     stdin.write(b"2")
     assert stdout.read(len(source_content)) == source_content
+
+
+def test_read_server_window(source_file, source_content, read_server):
+    stdin, stdout = read_server.stdin, io.BufferedReader(read_server.stdout)
+    stdin.write(f"{source_file}\n".encode())
+    stdout.readline()
+
+    stdin.write(b'4\nsha256\n0\n4\n{"window": 2, "depth": 2}\n')
+    blocks = [source_content[i : i + 4] for i in range(0, 16, 4)]
+    # Expect: The digests of the first two blocks are sent before any ack
+    assert stdout.read(64) == sha256(blocks[0]).digest() + sha256(blocks[1]).digest()
+    stdin.write(b"2")
+    assert stdout.read(4 + 32) == blocks[0] + sha256(blocks[2]).digest()
+    stdin.write(b"1")
+    assert stdout.read(32) == sha256(blocks[3]).digest()
+
+
+def test_read_server_without_ack(source_file, source_content, read_server):
+    stdin, stdout = read_server.stdin, io.BufferedReader(read_server.stdout)
+    stdin.write(f"{source_file}\n".encode())
+    stdout.readline()
+
+    stdin.write(b'4\nsha256\n0\n2\n{"ack": false}\n')
+    assert stdout.read() == sha256(source_content[:4]).digest() + sha256(source_content[4:8]).digest()
+
+
+def test_read_server_tail(source_file, source_content, read_server):
+    stdin, stdout = read_server.stdin, io.BufferedReader(read_server.stdout)
+    stdin.write(f"{source_file}\n".encode())
+    stdout.readline()
+
+    stdin.write(b'4\nsha256\n0\n1\n{"tail": [[4, 10]], "verify": true}\n')
+    assert stdout.read(32) == sha256(source_content[:4]).digest()
+    stdin.write(b"1")
+    stdin.close()
+    # Expect: The tail follows the blocks, then the digests of its blocks
+    assert stdout.read() == source_content[4:] + b"".join(
+        sha256(source_content[i : i + 4]).digest() for i in range(4, 14, 4)
+    )
+
+
+def test_read_server_tail_chunks(source_file, source_content, read_server):
+    stdin, stdout = read_server.stdin, io.BufferedReader(read_server.stdout)
+    stdin.write(f"{source_file}\n".encode())
+    stdout.readline()
+
+    stdin.write(b'4\nsha256\n0\n0\n{"tail": [[4, 10]], "verify": true, "chunk_size": 8}\n')
+    stdin.close()
+    # Expect: Each chunk is followed by the digests of the blocks it completes
+    assert stdout.read() == (
+        source_content[4:12]
+        + sha256(source_content[4:8]).digest()
+        + sha256(source_content[8:12]).digest()
+        + source_content[12:]
+        + sha256(source_content[12:]).digest()
+    )
+
+
+def test_read_block_in_chunks(mocker, source_file, source_content):
+    mocker.patch("blocksync._read_server.CHUNK_SIZE", 3)
+    with open(source_file, "rb") as fileobj:
+        # Expect: Blocks larger than a chunk are hashed without being kept
+        assert read_block(fileobj, 8, 8, sha256) == (8, 6, None, sha256(source_content[8:]).digest())
+        assert read_block(fileobj, 0, 2, sha256) == (0, 2, source_content[:2], sha256(source_content[:2]).digest())
+
+
+def test_read_server_missing_file(read_server, pytester):
+    read_server.stdin.write(f"{pytester.path / 'missing.img'}\n".encode())
+    assert int(read_server.stdout.readline()) == 0
+
+
+def test_read_ahead_error(mocker, source_file):
+    mocker.patch("blocksync._read_server.read_block", side_effect=OSError("read error"))
+    with open(source_file, "rb") as fileobj:
+        # Expect: The reader thread's error is raised instead of waiting forever
+        with pytest.raises(OSError):
+            list(read_ahead(fileobj, [0, 4], 4, sha256, 2, 2))
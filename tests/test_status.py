@@ -1,5 +1,8 @@
+import multiprocessing
+from hashlib import sha256
+
 from blocksync._consts import ByteSizes
-from blocksync._status import Blocks
+from blocksync._status import Blocks, SharedStatus
 
 
 def test_initialize_status(fake_status):
@@ -13,6 +16,8 @@ def test_add_block(fake_status):
     fake_status.add_block("same")
     fake_status.add_block("diff")
     assert fake_status.blocks == Blocks(same=2, diff=1, done=3)
+    fake_status.add_block("diff", 3)
+    assert fake_status.blocks == Blocks(same=2, diff=4, done=6)
 
 
 def test_get_rate(fake_status):
@@ -41,3 +46,46 @@ def test_get_rate(fake_status):
     # Expect: Return 100.00 when exceeding the total size
     fake_status.add_block("diff")
     assert fake_status.rate == 100.00
+
+    # Expect: Rate against the blocks of the synced extents
+    fake_status.extent_blocks = 22
+    assert fake_status.rate == 50.00
+
+
+def test_add_digests(fake_status):
+    # Expect: Unknown until every worker has reported
+    fake_status.add_digests(2, "sha256", b"b", b"b")
+    assert fake_status.verified is None
+
+    fake_status.add_digests(1, "sha256", b"a", b"a")
+    assert fake_status.src_digest == fake_status.dest_digest == sha256(b"ab").hexdigest()
+    assert fake_status.verified
+
+
+def test_add_digests_mismatch(fake_status):
+    fake_status.add_digests(1, "sha256", b"a", b"a")
+    fake_status.add_digests(2, "sha256", b"b", b"c")
+    assert fake_status.verified is False
+
+
+def test_add_copied_block(fake_status):
+    fake_status.add_block("copy")
+    assert fake_status.blocks == Blocks(same=0, diff=1, done=1)
+    assert fake_status.copied_blocks == 1
+
+
+def test_shared_status():
+    status = SharedStatus(workers=2, block_size=500, src_size=1_000)
+    status._set_worker(1)
+    status.add_block("same")
+    status._set_worker(2)
+    status.add_block("copy", 2)
+    # Expect: The counters of every worker are summed
+    assert status.blocks == Blocks(same=1, diff=2, done=3)
+    assert status.copied_blocks == 2
+
+    # Expect: Blocks added by a worker process are seen here
+    process = multiprocessing.Process(target=status.add_block, args=("diff",))
+    process.start()
+    process.join()
+    assert status.blocks == Blocks(same=1, diff=3, done=4)
@@ -1,9 +1,13 @@
+import subprocess
+import sys
+import threading
+from typing import Any, Callable, Dict, Tuple
 from unittest.mock import Mock
 
-import paramiko
+import pytest
 
+from blocksync._transport import LocalTransport
 from blocksync.sync import (
-    _connect_ssh,
     _do_create,
     _get_block_size,
     _get_blocks,
@@ -11,8 +15,27 @@ from blocksync.sync import (
     _get_remotedev_size,
     _get_size,
     _log,
+    _split_tail,
+    local_to_local,
+    local_to_remote,
+    remote_to_local,
 )
 
+SYNCS: Dict[str, Callable] = {
+    "local_to_local": local_to_local,
+    "local_to_remote": local_to_remote,
+    "remote_to_local": remote_to_local,
+}
+
+
+@pytest.fixture(params=SYNCS)
+def engine(request) -> Tuple[Callable, Dict[str, Any]]:
+    """
+    A sync function with the options it needs, the remote ones run their servers as local processes
+    """
+    options: Dict[str, Any] = {} if request.param == "local_to_local" else {"transport": LocalTransport()}
+    return SYNCS[request.param], options
+
 
 def test_get_block_size():
     assert _get_block_size(1) == 1
@@ -32,9 +55,9 @@ def test_get_size(source_file, source_content):
 def test_remotedev_size():
     stub_stdin = Mock()
     stub_stdout = Mock(readline=Mock(return_value=10))
-    stub_ssh_client = Mock(exec_command=Mock(return_value=(stub_stdin, stub_stdout, Mock())))
-    assert 10 == _get_remotedev_size(stub_ssh_client, "command", "path")
-    stub_stdin.write.assert_called_once_with("path\n")
+    stub_transport = Mock(exec_command=Mock(return_value=(stub_stdin, stub_stdout)))
+    assert 10 == _get_remotedev_size(stub_transport, "command", "path")
+    stub_stdin.write.assert_called_once_with(b"path\n\n")
     stub_stdout.readline.assert_called_once()
     stub_stdin.close.assert_called_once()
     stub_stdout.close.assert_called_once()
@@ -63,20 +86,294 @@ def test_log(mocker):
     mock_logger.log(10, f"[Worker {1}] test")
 
 
-def test_connect_ssh(mocker):
-    mock_ssh_client = mocker.patch("blocksync.sync.paramiko.SSHClient")()
-    _connect_ssh(
-        hostname="hostname",
-        password="password",
+def test_import_without_paramiko():
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, blocksync; assert 'paramiko' not in sys.modules"],
+    )
+    assert result.returncode == 0
+
+
+def test_local_to_remote(pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content[:4] + b"x" * (len(source_content) - 4))
+    _, status = local_to_remote(
+        str(source_file), str(dest), block_size=4, workers=2, wait=True, transport=LocalTransport()
+    )
+    assert dest.read_bytes() == source_content
+    assert status.blocks["same"] == 1
+    assert status.blocks["diff"] == 3
+
+
+def test_remote_to_local(pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content[:4] + b"x" * (len(source_content) - 4))
+    _, status = remote_to_local(
+        str(source_file), str(dest), block_size=4, workers=2, wait=True, transport=LocalTransport()
+    )
+    assert dest.read_bytes() == source_content
+    assert status.blocks["same"] == 1
+    assert status.blocks["diff"] == 3
+
+
+def test_local_to_local(pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content[:4] + b"x" * 4)
+    _, status = local_to_local(str(source_file), str(dest), block_size=4, workers=2, wait=True, verify=True)
+    assert dest.read_bytes() == source_content
+    assert status.blocks["same"] == 1
+    assert status.blocks["diff"] == 3
+    assert status.verified
+
+
+def test_verify_dryrun(pytester, source_file, source_content, engine):
+    sync, options = engine
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(b"x" * len(source_content))
+    _, status = sync(
+        str(source_file), str(dest), block_size=4, workers=2, wait=True, verify=True, dryrun=True, **options
+    )
+    assert status.verified is False
+
+
+def test_verify_remote(pytester, source_file, source_content):
+    for sync in (local_to_remote, remote_to_local):
+        dest = pytester.path / "dest.img"
+        dest.write_bytes(source_content[:4] + b"x" * (len(source_content) - 4))
+        _, status = sync(
+            str(source_file), str(dest), block_size=4, workers=2, wait=True, verify=True, transport=LocalTransport()
+        )
+        assert dest.read_bytes() == source_content
+        assert status.verified
+
+
+def test_dedup(pytester):
+    src = pytester.path / "src.img"
+    dest = pytester.path / "dest.img"
+    for sync in (local_to_remote, remote_to_local):
+        src.write_bytes(b"aaaabbbbaaaabbbb")
+        dest.write_bytes(b"aaaabbbbccccdddd")
+        _, status = sync(
+            str(src), str(dest), block_size=4, wait=True, verify=True, dedup=True, transport=LocalTransport()
+        )
+        assert dest.read_bytes() == b"aaaabbbbaaaabbbb"
+        assert status.blocks["diff"] == status.copied_blocks == 2
+        assert status.verified
+
+
+def test_dedup_later_blocks(pytester):
+    src = pytester.path / "src.img"
+    dest = pytester.path / "dest.img"
+    for src_content, dest_content, copied_blocks in (
+        # Moved blocks, the second one is overwritten before it is needed
+        (b"bbbbaaaacccc", b"aaaabbbbcccc", 1),
+        (b"tttttttttttt", b"xxxxxxxxtttt", 2),
+    ):
+        src.write_bytes(src_content)
+        dest.write_bytes(dest_content)
+        _, status = local_to_remote(
+            str(src), str(dest), block_size=4, wait=True, verify=True, dedup=True, transport=LocalTransport()
+        )
+        # Expect: Content found later in the destination is copied from there
+        assert dest.read_bytes() == src_content
+        assert status.copied_blocks == copied_blocks
+        assert status.verified
+
+
+@pytest.mark.parametrize("engine", ["local_to_local", "local_to_remote"], indirect=True)
+def test_converge(pytester, engine):
+    sync, options = engine
+    src = pytester.path / "src.img"
+    dest = pytester.path / "dest.img"
+    src.write_bytes(b"aaaabbbbccccdddd")
+    dest.write_bytes(b"xxxxxxxxxxxxxxxx")
+
+    def on_converge(status):
+        # Changed after the first pass, only the last pass can pick it up
+        with open(src, "rb+") as f:
+            f.seek(8)
+            f.write(b"CCCC")
+
+    _, status = sync(
+        str(src), str(dest), block_size=4, workers=2, wait=True, converge=True, on_converge=on_converge, **options
+    )
+    assert dest.read_bytes() == b"aaaabbbbCCCCdddd"
+    assert status.blocks["diff"] == 5
+
+
+@pytest.mark.parametrize("engine", ["local_to_local", "local_to_remote"], indirect=True)
+def test_converge_setup_error(mocker, pytester, source_file, engine):
+    sync, options = engine
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(b"x" * 16)
+    split_tail = _split_tail
+
+    def fail_once(*args):
+        mocker.patch("blocksync.sync._split_tail", split_tail)
+        raise OSError("setup error")
+
+    mocker.patch("blocksync.sync._split_tail", fail_once)
+    on_error = Mock()
+    manager, _ = sync(str(source_file), str(dest), block_size=4, workers=2, converge=True, on_error=on_error, **options)
+    waiter = threading.Thread(target=manager.wait_sync)
+    waiter.start()
+    waiter.join(timeout=10)
+    # Expect: A worker failing before its sync loop releases the other one and reports the error
+    assert not waiter.is_alive()
+    assert isinstance(on_error.call_args[0][0], OSError)
+
+
+def test_converge_options(source_file):
+    with pytest.raises(ValueError):
+        local_to_local(str(source_file), str(source_file), converge=True, dryrun=True)
+    with pytest.raises(ValueError):
+        local_to_local(str(source_file), str(source_file), converge=True, verify=True)
+    with pytest.raises(ValueError):
+        local_to_local(str(source_file), str(source_file), converge=True, extents=[(0, 1)])
+    with pytest.raises(ValueError):
+        local_to_local(str(source_file), str(source_file), converge=True, processes=True)
+
+
+@pytest.mark.parametrize("pipeline_depth", [1, 4])
+def test_pipeline(pytester, source_file, source_content, pipeline_depth, engine):
+    sync, options = engine
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content[:4] + b"x" * (len(source_content) - 4))
+    _, status = sync(
+        str(source_file),
+        str(dest),
+        block_size=4,
+        workers=2,
+        wait=True,
+        verify=True,
+        pipeline_depth=pipeline_depth,
+        **options,
     )
-    mock_ssh_client.set_missing_host_key_policy.assert_called_once_with(paramiko.AutoAddPolicy)
-    mock_ssh_client.load_system_host_keys.assert_called_once()
-    mock_ssh_client.connect.assert_called_once_with(
-        hostname="hostname",
-        password="password",
-        compress=True,
+    assert dest.read_bytes() == source_content
+    assert status.blocks["same"] == 1
+    assert status.verified
+
+
+def test_extents(pytester, engine):
+    sync, options = engine
+    src = pytester.path / "src.img"
+    dest = pytester.path / "dest.img"
+    src.write_bytes(b"aaaabbbbccccdddd")
+    dest.write_bytes(b"xxxxxxxxxxxxxxxx")
+    _, status = sync(str(src), str(dest), block_size=4, workers=2, wait=True, extents=[(5, 1), (12, 4)], **options)
+    # Expect: Only the blocks overlapping the extents are synced
+    assert dest.read_bytes() == b"xxxxbbbbxxxxdddd"
+    assert status.blocks["done"] == status.extent_blocks == 2
+
+
+def test_tail(pytester, source_file, source_content, engine):
+    sync, options = engine
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content[:4])
+    _, status = sync(str(source_file), str(dest), block_size=4, workers=2, wait=True, verify=True, **options)
+    assert dest.read_bytes() == source_content
+    assert status.dest_size == 4
+    assert status.blocks == {"same": 1, "diff": 3, "done": 4}
+    assert status.verified
+
+
+@pytest.mark.parametrize("engine", ["local_to_local", "remote_to_local"], indirect=True)
+def test_missing_dest(pytester, source_file, engine):
+    sync, options = engine
+    # Expect: A missing destination is only created on request
+    with pytest.raises(FileNotFoundError):
+        sync(str(source_file), str(pytester.path / "missing.img"), wait=True, **options)
+    # Expect: Nor on a dry run
+    with pytest.raises(FileNotFoundError):
+        sync(str(source_file), str(pytester.path / "missing.img"), wait=True, dryrun=True, create_dest=True, **options)
+    assert not (pytester.path / "missing.img").exists()
+
+
+def test_create_and_truncate_dest(pytester, source_file, source_content, engine):
+    sync, options = engine
+    dest = pytester.path / "dest.img"
+    dest.unlink(missing_ok=True)
+    sync(str(source_file), str(dest), block_size=4, wait=True, create_dest=True, **options)
+    assert dest.read_bytes() == source_content
+
+    dest.write_bytes(source_content + b"extra")
+    sync(str(source_file), str(dest), block_size=4, wait=True, truncate_dest=True, **options)
+    assert dest.read_bytes() == source_content
+
+
+def test_large_blocks(mocker, pytester, source_file, source_content, engine):
+    sync, options = engine
+    # Blocks larger than a chunk are streamed in chunks
+    mocker.patch("blocksync.sync.CHUNK_SIZE", 3)
+    mocker.patch("blocksync._pipeline.CHUNK_SIZE", 3)
+    dest = pytester.path / "dest.img"
+    for pipeline_depth in (0, 2):
+        dest.write_bytes(source_content[:4] + b"x" * 4)
+        _, status = sync(
+            str(source_file),
+            str(dest),
+            block_size=4,
+            wait=True,
+            verify=True,
+            pipeline_depth=pipeline_depth,
+            **options,
+        )
+        assert dest.read_bytes() == source_content
+        assert status.blocks == {"same": 1, "diff": 3, "done": 4}
+        assert status.verified
+
+
+def test_processes(pytester, source_file, source_content):
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content[:4] + b"x" * 4)
+    hooks = Mock()
+    _, status = local_to_local(
+        str(source_file),
+        str(dest),
+        block_size=4,
+        workers=2,
+        wait=True,
+        verify=True,
+        processes=True,
+        on_before=hooks.on_before,
+        on_after=hooks.on_after,
     )
+    assert dest.read_bytes() == source_content
+    assert status.blocks == {"same": 1, "diff": 3, "done": 4}
+    assert status.verified
+    # Expect: The hooks of each worker run in this process
+    assert hooks.on_before.call_count == hooks.on_after.call_count == 2
+
+
+def test_processes_error(mocker, pytester, source_file, source_content):
+    mocker.patch("blocksync.sync.read_blocks", side_effect=OSError("read error"))
+    dest = pytester.path / "dest.img"
+    dest.write_bytes(source_content)
+    on_error = Mock()
+    local_to_local(str(source_file), str(dest), wait=True, processes=True, on_error=on_error)
+    # Expect: The error raised in the worker process is reported here
+    assert isinstance(on_error.call_args[0][0], OSError)
+
+
+def test_remote_to_local_cancel(pytester):
+    src = pytester.path / "src.img"
+    dest = pytester.path / "dest.img"
+    src.write_bytes(b"a" * 4096)
+    # The second half is sent as a tail once the blocks are done
+    dest.write_bytes(b"x" * 2048)
+    manager, _ = remote_to_local(str(src), str(dest), block_size=4, sync_interval=0.001, transport=LocalTransport())
+    manager.cancel_sync()
+    waiter = threading.Thread(target=manager.wait_sync)
+    waiter.start()
+    waiter.join(timeout=10)
+    # Expect: The worker stops the read server instead of waiting for the tail
+    assert not waiter.is_alive()
+
 
-    mock_ssh_client.reset_mock()
-    _connect_ssh(allow_load_system_host_keys=False)
-    mock_ssh_client.load_system_host_keys.assert_not_called()
+def test_truncate_dest_dryrun(pytester, source_file, source_content, engine):
+    sync, options = engine
+    dest = pytester.path / "dest.img"
+    for resize_option in ("truncate_dest", "create_dest"):
+        dest.write_bytes(source_content + b"extra")
+        sync(str(source_file), str(dest), block_size=4, wait=True, dryrun=True, **{resize_option: True}, **options)
+        # Expect: A dry run leaves the destination alone
+        assert dest.read_bytes() == source_content + b"extra"
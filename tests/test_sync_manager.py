@@ -1,6 +1,7 @@
+import multiprocessing
 from unittest.mock import Mock
 
-from blocksync._sync_manager import SyncManager
+from blocksync._sync_manager import ProcessSyncManager, SyncManager
 
 
 def test_cancel_sync():
@@ -43,3 +44,21 @@ def test_finished():
 
     worker.is_alive.return_value = True
     assert not manager.finished
+
+
+def test_process_sync_manager():
+    manager = ProcessSyncManager()
+    manager.suspend()
+    assert manager.suspended
+
+    # Expect: Requests made in another process are seen here
+    process = multiprocessing.Process(target=manager.resume)
+    process.start()
+    process.join()
+    assert not manager.suspended
+    manager._wait_resuming()
+
+    process = multiprocessing.Process(target=manager.cancel_sync)
+    process.start()
+    process.join()
+    assert manager.canceled
@@ -0,0 +1,134 @@
+import hashlib
+import os
+from unittest.mock import MagicMock, Mock
+
+import paramiko
+import pytest
+
+from blocksync._transport import (
+    LocalTransport,
+    OpenSSHTransport,
+    ParamikoTransport,
+    Transport,
+    _connect_ssh,
+    _deploy_server_script,
+    get_transport,
+)
+from blocksync.sync import DEFAULT_READ_SERVER_SCRIPT_PATH, READ_SERVER_SCRIPT_NAME
+
+
+def test_connect_ssh(mocker):
+    mock_ssh_client = mocker.patch("paramiko.SSHClient")()
+    _connect_ssh(
+        hostname="hostname",
+        password="password",
+    )
+    mock_ssh_client.set_missing_host_key_policy.assert_called_once_with(paramiko.AutoAddPolicy)
+    mock_ssh_client.load_system_host_keys.assert_called_once()
+    mock_ssh_client.connect.assert_called_once_with(
+        hostname="hostname",
+        password="password",
+        compress=True,
+    )
+
+    mock_ssh_client.reset_mock()
+    _connect_ssh(allow_load_system_host_keys=False)
+    mock_ssh_client.load_system_host_keys.assert_not_called()
+
+
+def test_deploy_server_script():
+    with open(DEFAULT_READ_SERVER_SCRIPT_PATH, "rb") as f:
+        script = f.read()
+    digest = hashlib.sha256(script).hexdigest()
+    remote_path = f".cache/blocksync/{digest[:16]}/{READ_SERVER_SCRIPT_NAME}"
+
+    # Expect: Upload the script when it is not installed yet
+    mock_sftp = Mock(open=Mock(side_effect=IOError), stat=Mock(side_effect=IOError))
+    stub_ssh_client = Mock(open_sftp=Mock(return_value=mock_sftp))
+    command = _deploy_server_script(stub_ssh_client, DEFAULT_READ_SERVER_SCRIPT_PATH)
+    assert command == f"python3 {remote_path}"
+    assert mock_sftp.mkdir.call_count == 3
+    # Expect: The script is uploaded to a temporary name in the same directory, then renamed into place
+    mock_sftp.put.assert_called_once()
+    local_path, tmp_path = mock_sftp.put.call_args.args
+    assert local_path == DEFAULT_READ_SERVER_SCRIPT_PATH
+    assert os.path.dirname(tmp_path) == os.path.dirname(remote_path) and tmp_path != remote_path
+    mock_sftp.posix_rename.assert_called_once_with(tmp_path, remote_path)
+    mock_sftp.close.assert_called_once()
+
+    # Expect: Skip uploading when the installed script matches
+    installed = MagicMock()
+    installed.__enter__.return_value.read.return_value = script
+    mock_sftp = Mock(open=Mock(return_value=installed))
+    stub_ssh_client = Mock(open_sftp=Mock(return_value=mock_sftp))
+    assert command == _deploy_server_script(stub_ssh_client, DEFAULT_READ_SERVER_SCRIPT_PATH)
+    mock_sftp.put.assert_not_called()
+
+    # Expect: Reinstall when the installed script has been modified
+    installed.__enter__.return_value.read.return_value = b"modified"
+    _deploy_server_script(stub_ssh_client, DEFAULT_READ_SERVER_SCRIPT_PATH)
+    mock_sftp.put.assert_called_once()
+    mock_sftp.posix_rename.assert_called_once_with(mock_sftp.put.call_args.args[1], remote_path)
+
+
+def test_local_transport(source_file, source_content):
+    transport = LocalTransport()
+    stdin, stdout = transport.exec_command(transport.server_command(DEFAULT_READ_SERVER_SCRIPT_PATH))
+    stdin.write(f"{source_file}\n".encode())
+    stdin.flush()
+    assert int(stdout.readline()) == len(source_content)
+    stdin.close()
+    stdout.close()
+    transport.close()
+    assert not transport.processes
+
+
+def test_local_transport_reaps_processes(source_file):
+    transport = LocalTransport()
+    command = transport.server_command(DEFAULT_READ_SERVER_SCRIPT_PATH)
+    stdin, stdout = transport.exec_command(command)
+    stdin.write(b"missing.img\n\n")
+    stdin.close()
+    stdout.read()
+    stdout.close()
+    finished = transport.processes[0]
+    finished.wait()
+    stdin, stdout = transport.exec_command(command)
+    # Expect: Finished servers are not kept around when the transport is reused
+    assert len(transport.processes) == 1 and finished not in transport.processes
+    stdin.close()
+    stdout.close()
+    transport.close()
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        Transport()  # type: ignore[abstract]
+
+
+def test_openssh_transport():
+    transport = OpenSSHTransport("hostname", port=2222, username="username", key_filename="key", compress=False)
+    args = transport._get_args("command")
+    assert args[0] == "ssh"
+    assert "-C" not in args
+    assert args[-2:] == ["hostname", "command"]
+    assert ["-p", "2222"] == args[args.index("-p") : args.index("-p") + 2]
+    assert ["-l", "username"] == args[args.index("-l") : args.index("-l") + 2]
+    assert ["-i", "key"] == args[args.index("-i") : args.index("-i") + 2]
+
+    # Expect: Send the script on the command line instead of deploying it
+    command = transport.server_command(DEFAULT_READ_SERVER_SCRIPT_PATH)
+    assert command.startswith("python3 -c ")
+    assert "hashlib" in command
+
+
+def test_get_transport(mocker):
+    transport = LocalTransport()
+    assert get_transport(transport) is transport
+    assert isinstance(get_transport("openssh", hostname="hostname"), OpenSSHTransport)
+
+    mocker.patch("paramiko.SSHClient")
+    assert isinstance(get_transport("paramiko", hostname="hostname"), ParamikoTransport)
+
+    with pytest.raises(ValueError):
+        get_transport("unknown")
@@ -13,9 +13,61 @@ def test_write_server(pytester):
     stdin = p.stdin
     dest_file_path = str(pytester.path / "dest.img")
     expected_dest_file_content = b"a" * 20
-    stdin.write(f"{dest_file_path}\n20\n20\n0\n1\n".encode())
-    stdin.write(b"2")
+    stdin.write(f"{dest_file_path}\n20\n20\n0\n1\n{{}}\n".encode())
+    stdin.write(b"2" + b"20\n")
     stdin.write(expected_dest_file_content)
     p.wait()
     dest_file = open(dest_file_path, "rb")
     assert dest_file.read() == expected_dest_file_content
+
+
+def test_write_server_tail(pytester):
+    p = pytester.popen(
+        ["python", (BASE_DIR / "_write_server.py")],
+        bufsize=0,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    dest_file_path = pytester.path / "dest.img"
+    dest_file_path.write_bytes(b"x" * 4)
+    p.stdin.write(f'{dest_file_path}\n0\n4\n0\n1\n{{"tail": [[4, 6]]}}\n'.encode())
+    p.stdin.write(b"1")
+    p.stdin.write(b"2" + b"4\n" + b"abcd")
+    p.stdin.write(b"2" + b"2\n" + b"ef")
+    # Expect: Exit once the tail is written, without waiting for EOF
+    assert p.wait() == 0
+    # Expect: The tail chunks are appended after the skipped block
+    assert dest_file_path.read_bytes() == b"xxxxabcdef"
+
+
+def test_write_server_create(pytester):
+    p = pytester.popen(
+        ["python", (BASE_DIR / "_write_server.py")],
+        bufsize=0,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    dest_file_path = pytester.path / "dest.img"
+    p.stdin.write(f"{dest_file_path}\n10\n\n".encode())
+    # Expect: Exit after creating the destination when the header is empty, without waiting for EOF
+    assert p.wait() == 0
+    assert dest_file_path.stat().st_size == 10
+
+
+def test_write_server_end(pytester):
+    p = pytester.popen(
+        ["python", (BASE_DIR / "_write_server.py")],
+        bufsize=0,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    dest_file_path = pytester.path / "dest.img"
+    dest_file_path.write_bytes(b"x" * 8)
+    p.stdin.write(f'{dest_file_path}\n0\n4\n0\n2\n{{"verify": "sha256"}}\n'.encode())
+    # A partial last block carries its length
+    p.stdin.write(b"2" + b"2\n" + b"ab")
+    p.stdin.write(b"4")
+    # Expect: Stop at the end opcode without waiting for EOF, and without a digest
+    assert p.wait() == 0
+    assert p.stdout.read() == b""
+    assert dest_file_path.read_bytes() == b"abxxxxxx"